@@ -13,59 +13,95 @@
 # python_version  : 3.*
 # _________________________________________________________________________________________________________________
 
+import os
+import sys
 import time
 import glob
 
-import numpy as np
 import pandas as pd
 
+# shared routines
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fam import baseline, cache, cli, columnar, compact, cube, delta, districts, features, history, incremental, ingest, instrument, interpolate, lookup, mapping, parallel, pipeline, shards, stream, sweep
+
 # warning handling
 pd.options.mode.chained_assignment = None
 
+# command line options
+args = cli.parse('Nevada')
+
+# record wall time, cpu time and memory of every stage to output/Nevada_Report.json and .csv
+instrument.begin('output/Nevada', args.profile)
+
+# partial writes of an interrupted run, every completed year, baseline and cache entry is kept
+if args.resume:
+    print("Removed", incremental.clean(['cache', 'output']), "partial files of an interrupted run.\n")
+
 # start script time
 start = time.time()
 
-# field status                        cdl
-crp = 4 # cropped                     -> 2
-flw = 3 # fallow                      -> 10
-pin = 2 # partially irrigated normal  -> 8
-pop = 1 # partially irrigated poor    -> 9
+# input data paths (raw csvs, or .npz parts inside a shard workspace)
+files = [x for x in glob.glob('input/*/*.csv') + glob.glob('input/*/*.npz')]
 
-# input data paths
-files = [x for x in glob.glob('input/*/*.csv')]
+# legislative districts and field centroids (id, lon, lat) of the district summaries
+shapefile = '../../maps/geospacial/basemaps/nev/cb_2018_32_sldl_500k.shp'
+centroids = '../../maps/geospacial/nv_gps.csv'
 
-# export csv file
-export = lambda df, name: df.to_csv(name + '.csv', header=True)
+if args.districts and not all(map(os.path.exists, [shapefile, centroids])):
+    sys.exit("--districts requires " + shapefile + " and " + centroids)
 
-# smoothing filter
-smooth = lambda df: df.rolling(window=5,min_periods=0,axis=1,center=True).mean()
+# years of input data
+input_years = [2006, 2008, 2009, 2010, 2011, 2013, 2014, 2015, 2016, 2017, 2018, 2019]
 
-# create time stamp
-snapshot = lambda start: str(round((time.time() - start)/60,3))
+# historic reference years
+hist_years = args.baseline_years or [2006, 2008, 2009, 2010, 2017]
 
-# convert to standard cdl codes
-def decode(field_status):
-    """Maps field status to standard cdl code.
+# years to classify, a targeted run only loads these and the years they depend on
+target_years = args.year or input_years
 
-    Uses a series of vectorized operations to sequentially map input to
-    corresponding cdl code.
+# export .csv file, written to a temporary file and renamed so an interrupted run leaves no partial file
+export = lambda df, name: cache.write(name + '.csv', lambda f: df.to_csv(f, header=True), 'w')
 
-    Args:
-        field_status (ndarray): An array object containing hierarchical
-        field codes.
+# input data paths by year
+select = lambda year: list(filter(lambda x:str(year) in x, files))
 
-    Returns:
-        ndarray: Mapped values to corresponding cdl code.
-    """
-    field_status = np.where(field_status == pin, 8, field_status)
-    field_status = np.where(field_status == pop, 9, field_status)
-    field_status = np.where(field_status == flw, 10, field_status)
-    field_status = np.where(field_status == crp, 2, field_status)
+# cache entry of a processed year, compact years are kept apart from float64 ones
+entry = lambda year, compact=args.compact: ('cache/yr32_' if compact else 'cache/yr_')+str(year)
+
+# cached, processed year
+load = lambda year, compact=args.compact: cache.fetch(entry(year, compact), select(year), year,
+ lambda files, year: process(files, year, compact))
+
+# statuses of a classified year kept for the multi-year history
+status = lambda year: 'cache/status_'+str(year)
+
+# historic reference years of a classified year
+refs = lambda year: baseline.reference(year, input_years, hist_years, args.baseline_trailing, args.baseline_exclude)
 
-    return field_status
+# export names of a classified year, .csv files or columnar partitions by state, year and season
+names = lambda year: (['output/Nevada_'+str(year)] if args.output == 'csv'
+ else [columnar.partition('Nevada', year, 'season')])
 
+# export files of a classified year
+outputs = lambda year: [x+'.'+args.output for x in names(year)]
 
-def process(files, year):
+# delta exports and change log of a classified year
+deltas = lambda year: [x.replace('output', os.path.join('output', 'delta'), 1) for x in names(year)]
+changes = lambda year: os.path.join('output', 'delta', 'Nevada_Changes_'+str(year))
+
+# write a classified season in the chosen format, or update rows of an existing export
+save = lambda df, name: columnar.write(df, name, args.output, args.output_mode == 'full')
+update = lambda df, name: columnar.merge(df, name, args.output)
+
+# everything the exports of a classified year depend on
+signature = lambda year: incremental.signature([entry(x) for x in [year]+refs(year)],
+ [os.path.abspath(__file__)]) + ':' + args.output_mode
+
+# growing season bounds
+seasons = {'season': (8, 38)}
+
+
+def process(files, year, compact=False):
     """Reads, formats, and restructures data.
 
     Uses a series operations to merge multiple .csv files together to format ndvi
@@ -77,62 +113,78 @@ def process(files, year):
 
         year (int): Corresponding year to input data.
 
+        compact (bool): Read float32 ndvi and int32 ids instead of float64 and int64.
+
     Returns:
         DataFrame: A pandas object with properly formatted times series data.
     """
-    df = pd.concat([pd.read_csv(x, usecols=[1,2,3], parse_dates=[2], header=0,
-        names=['ndvi', 'id', 'date']) for x in files])
+    # scatter max observation per id and date into a dense matrix
+    with instrument.stage('ingest', year) as stage:
+        ids, cols, ndvi = ingest.grid(ingest.stream(files, compact, args.threads), year, shards.layout(files))
+        stage['rows'] = len(ids)
 
-    # create any missing observations on 8 day interval for single id
-    dates = pd.date_range("1-01-"+str(year), freq='8D', periods=46)
-    dates = pd.Series(dates.format()).tolist()
-    df = df.append(pd.DataFrame({'ndvi':np.nan,'id':1,'date':dates}), ignore_index=True)
+    with instrument.stage('interpolate', year) as stage:
+        # linearly interpolate by id and constrain data to 8 day intervals
+        df, filled = interpolate.intervals(ids, cols, ndvi, year)
+        stage['rows'] = len(df)
 
-    # merge, sort, and keep max duplicate
-    df = df.sort_values(['id','date','ndvi'])
-    df = df.drop_duplicates(subset=['id','date'], keep='last').iloc[1:]
+    print(year, "interpolation filled", round(filled.mean(), 2), "of 46 values per field.\n")
 
-    # pivot shape for increased efficiency
-    df = df.pivot(index='id', columns='date', values='ndvi')
+    return df
 
-    # linearly interpolate by grouped id
-    df.interpolate(method='linear',axis=1,limit_direction='both',inplace=True)
+# years to load, every year unless a targeted run needs fewer
+load_years = incremental.needed(target_years, refs)
 
-    # constrain data to 8 day intervals
-    df = df[dates].dropna()
+# run field shards one after another with bounded memory, then merge their exports
+if args.shard_size:
+    with instrument.stage('shards'):
+        shards.run(os.path.abspath(__file__), input_years, select, args.shard_size, cli.strip(sys.argv[1:], '--shard-size'))
+    sys.exit()
 
-    return df
+# fold newly arrived files into their cached years in place, keeping the fields that changed
+streamed = {}
+if args.append:
+    appended = [os.path.normpath(x) for x in args.append]
+    for year in target_years:
+        new = [x for x in select(year) if os.path.normpath(x) in appended]
+        with instrument.stage('stream', year):
+            streamed[year] = stream.append(entry(year), select(year), new, year, args.compact, args.threads)
 
-print("Processing initiated at",snapshot(start),"minutes.\n")
+# years processed up front, a pipelined run reads them while classifying
+ahead = [] if args.pipeline else load_years
 
-yr_2006 = process(list(filter(lambda x:'2006' in x, files)), 2006)
-yr_2008 = process(list(filter(lambda x:'2008' in x, files)), 2008)
-yr_2009 = process(list(filter(lambda x:'2009' in x, files)), 2009)
-yr_2010 = process(list(filter(lambda x:'2010' in x, files)), 2010)
-yr_2011 = process(list(filter(lambda x:'2011' in x, files)), 2011)
-yr_2013 = process(list(filter(lambda x:'2013' in x, files)), 2013)
-yr_2014 = process(list(filter(lambda x:'2014' in x, files)), 2014)
-yr_2015 = process(list(filter(lambda x:'2015' in x, files)), 2015)
-yr_2016 = process(list(filter(lambda x:'2016' in x, files)), 2016)
-yr_2017 = process(list(filter(lambda x:'2017' in x, files)), 2017)
-yr_2018 = process(list(filter(lambda x:'2018' in x, files)), 2018)
-yr_2019 = process(list(filter(lambda x:'2019' in x, files)), 2019)
+# process years in parallel, results are handed back through the memory-mapped cache
+with instrument.stage('process'):
+    parallel.each(load, ahead, args.workers)
 
-print("Processing completed at",snapshot(start),"minutes.\n")
+# load each year from the binary cache, rebuilding only those with changed inputs
+with instrument.stage('cache_load') as stage:
+    years = {year: load(year) for year in ahead}
+    stage['rows'] = sum(len(x) for x in years.values())
 
-print("Historic calculations initiated at",snapshot(start),"minutes.\n")
+# store smoothed season maxima of every loaded year once, baselines are derived from these tables
+with instrument.stage('baseline'):
+    parallel.each(lambda year: baseline.table(entry(year)), ahead, args.workers)
 
-# all years
-years = [yr_2006, yr_2008, yr_2009, yr_2010, yr_2011, yr_2013, yr_2015, yr_2014, yr_2016, yr_2017, yr_2018, yr_2019]
 
-# historic years
-hist_years = [yr_2006, yr_2008, yr_2009, yr_2010, yr_2017]
+def historic(year, ids, compact=args.compact):
+    """Calculates historic maximums for smoothed ts.
 
-# calculate 5 year maximums for smoothed ts
-max_smooth = np.array([smooth(df).max(axis=1) for df in hist_years]).max(0)
-max_smooth_5yr = pd.DataFrame({'id':yr_2018.index.values,'ndvi_smooth_5yr_max':max_smooth})
+    Takes the highest smoothed value of the full year over the reference years
+    of a classified year from the stored tables, joined by id.
+
+    Args:
+        year (int): The year being classified.
 
-print("Historic calculations completed at",snapshot(start),"minutes.\n")
+        ids (Index): Field ids of the classified year.
+
+        compact (bool): Derive the maximums from the compact cache entries.
+
+    Returns:
+        Series: A pandas object indexed by id with the historic maximum.
+    """
+    with instrument.stage('baseline_derive', year):
+        return baseline.derive([entry(x, compact) for x in refs(year)], ids)['year']
 
 # variables to tune
 ndvi_max_threshold = 0.55
@@ -140,81 +192,183 @@ ndvi_min_threshold = 0.4
 ndvi_perc_historic_threshold1 = 0.7
 ndvi_perc_historic_threshold2 = 0.5
 
-# ________________________________________DATE CONVERSION_________________________________________
-#|01-01|01-09|01-17|01-25|02-02|02-10|02-18|02-26|03-06|03-14|03-22|03-30|04-07|04-15|04-23|05-01|
-#|  0  |  1  |  2  |  3  |  4  |  5  |  6  |  7  |  8  |  9  |  10 |  11 |  12 |  13 |  14 |  15 |
-#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
-#|05-09|05-17|05-25|06-02|06-10|06-18|06-26|07-04|07-12|07-20|07-28|08-05|08-13|08-21|08-29|09-06|
-#|  16 |  17 |  18 |  19 |  20 |  21 |  22 |  23 |  24 |  25 |  26 |  27 |  28 |  29 |  30 |  31 |
-#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
-#|09-14|09-22|09-30|10-08|10-16|10-24|11-01|11-09|11-17|11-25|12-03|12-11|12-19|12-27|     |     |
-#|  32 |  33 |  34 |  35 |  36 |  37 |  38 |  39 |  40 |  41 |  42 |  43 |  44 |  45 |     |     |
-#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
+# thresholds by name, as the shared fallow mapping rules and the sweep take them
+thresholds = {'ndvi_max_threshold': ndvi_max_threshold, 'ndvi_min_threshold': ndvi_min_threshold,
+ 'ndvi_perc_historic_threshold1': ndvi_perc_historic_threshold1, 'ndvi_perc_historic_threshold2': ndvi_perc_historic_threshold2}
+
+def tune(year):
+    """Evaluates the threshold combinations of the sweep on a single year.
 
+    Args:
+        year (int): Year to evaluate.
+    """
+    df, hist = years[year], historic(year, years[year].index)
+    feats = features.seasons(df.values, seasons)
+    area = sweep.areas(args.sweep_area, df.index) if args.sweep_area else None
+
+    with instrument.stage('tune', year):
+        export(sweep.sweep(feats, {'season': hist.values}, combos, area=area),
+         'output/Nevada_Sweep_'+str(year))
 
-def fallowMapping(df):
-    """Performs initial classification results by season.
+# evaluate a grid of thresholds on the features of each year instead of classifying
+if args.sweep:
+    combos = sweep.read(args.sweep, thresholds)
 
-    Applies a series rules to periods of partitioned data. Rules perform
-    vectorized operations and are detailed in the comments. Assigned field
-    statuses are hierarchical in nature and must be converted to their
-    respective cdl codes.
+    print("Sweeping", len(combos), "threshold combinations.\n")
+    with instrument.stage('sweep'):
+        parallel.each(tune, target_years, args.workers)
+    sys.exit()
+
+def check(year, fam):
+    """Compares the compact classification of a year with the float64 path.
 
     Args:
-        df (DataFrame): A pandas object which contains formatted ndvi time
-                        series data.
+        year (int): The year being classified.
 
-        season (str): A season either "spring", "summer", or "overlap".
+        fam (list): Compact classified season of the year.
+    """
+    df = load(year, False)
+    ref = [mapping.growingSeason(df, historic(year, df.index, False), thresholds, seasons['season'])]
+
+    export(compact.report(ref, fam, ['season']),'output/Nevada_Compact_'+str(year))
+
+def classify(year):
+    """Classifies a single year.
+
+    Args:
+        year (int): Year to classify.
 
     Returns:
-        DataFrame: A pandas object with classified times series data.
+        tuple: The year, its classified seasons and the function writing them.
     """
-    df = df.iloc[:,8:38]
-
-    df_smooth = pd.DataFrame(np.sort(smooth(df).values, axis=1), columns=df.columns)
-    df_sorted = pd.DataFrame(np.sort(df.values, axis=1), columns=df.columns)
+    df, hist = years[year], historic(year, years[year].index)
 
-    # highest ndvi values from the original, linearly interpolated ts
-    ndvi_max1 = df_sorted.iloc[:,-1]
-    ndvi_max4 = df_sorted.iloc[:,-4]
+    # after a streamed update only fields whose series changed are classified again
+    rows, write = slice(None), save
+    if streamed.get(year) is not None and all(os.path.exists(x) for x in outputs(year)):
+        rows, write = df.index.isin(streamed[year]), update
 
-    # highest ndvi values from the smoothed ts
-    ndvi_smoothed_max1 = df_smooth.iloc[:,-1]
+    with instrument.stage('fallowMapping', year, 'season') as stage:
+        fam = [mapping.growingSeason(df[rows], hist[rows], thresholds, seasons['season'])]
+        stage['rows'] = len(fam[0])
 
-    # check cropped
-    rule1 = np.where(ndvi_max4 >= ndvi_max_threshold, crp, -9999)
+    # compact exports carry int16 statuses and float32 values
+    if args.compact:
+        fam = [compact.shrink(x) for x in fam]
 
-    # check fallow
-    rule3 = np.where(ndvi_max1 < ndvi_min_threshold, flw, -9999)
+    return year, fam, write
 
-    # check fields between 0.4 and 0.6 relative to historic average
-    rule4 = np.where(ndvi_smoothed_max1 >= (ndvi_perc_historic_threshold1*max_smooth_5yr['ndvi_smooth_5yr_max']), pin, -9999)
+def publish(result):
+    """Exports a classified year and stamps it as up to date.
 
-    # check for partially irrigated
-    rule5 = np.where(ndvi_smoothed_max1 >= (ndvi_perc_historic_threshold2*max_smooth_5yr['ndvi_smooth_5yr_max']), pop, -9999)
+    Args:
+        result (tuple): Output of classify().
+    """
+    year, fam, write = result
 
-    # check for fields that are less than 50% of historical average
-    rule6 = np.where(ndvi_smoothed_max1 < (ndvi_perc_historic_threshold2*max_smooth_5yr['ndvi_smooth_5yr_max']), flw, -9999)
+    with instrument.stage('export', year):
+        write(fam[0],names(year)[0])
 
-    # calculate percent 5 year average
-    pnorm = np.where(True, round(ndvi_smoothed_max1/max_smooth_5yr['ndvi_smooth_5yr_max'], 4)*100, -9999)
+        # rows whose status changed since the previous export, compared before the statuses are replaced
+        if args.delta:
+            rows, log = delta.diff(history.vector(status(year)), fam, ['season'], write is update)
+            for df, name in zip(rows, deltas(year)):
+                save(df, name)
+            columnar.write(log, changes(year), args.output)
 
-    # classify field status via hierarchical merge
-    field_status = decode(np.maximum.reduce([rule1, rule3, rule4, rule5, rule6]))
+        history.store(status(year), fam, ['season'], write is update, staged=True)
 
-    # add classifications & historical averages
-    df.insert(0, 'percent_5yr_Avg', pnorm)
-    df.insert(0, 'field_status', field_status)
+    if args.compact_report:
+        with instrument.stage('compact_report', year):
+            check(year, fam)
+    incremental.mark(year, signature(year))
 
-    return df
+    # the statuses become the base of the next delta only once the year is stamped
+    history.settle(status(year), True)
 
-print("Classifications initiated at",snapshot(start),"minutes.\n")
+    # release the year, a pipelined run only holds the few years in flight
+    years.pop(year, None)
 
-for year in years:
-    name = [x for x in globals() if globals()[x] is year][0]
-    export(fallowMapping(year),'output/Nevada_'+name[3:7])
+def ready():
+    """Reads years in the order the classified years need them.
 
-print("Classifications & exports completed at",snapshot(start),"minutes.\n")
+    Yields:
+        int: Each year to classify, once it and its reference years are read.
+    """
+    for year, released in pipeline.order(sorted(target_years, reverse=True), lambda x: [x]+refs(x)):
+        with instrument.stage('read', year):
+            df = load(year)
+            baseline.table(entry(year))
+            if year in target_years:
+                years[year] = df
+
+        for x in released:
+            if unchanged(x):
+                print("Skipping unchanged year:", x, "\n")
+                years.pop(x, None)
+                continue
+            yield x
+
+# float64 years the compact classification is compared against, cached before the workers read them
+if args.compact_report:
+    with instrument.stage('compact_reference'):
+        parallel.each(lambda year: load(year, False), load_years, args.workers)
+        parallel.each(lambda year: baseline.table(entry(year, False)), load_years, args.workers)
+
+# a targeted or resumed run skips years exported from the same inputs, baseline and script
+unchanged = lambda year: (args.year or args.resume) and incremental.current(year, signature(year), outputs(year))
+
+# statuses staged by an interrupted export are kept if it was stamped, otherwise the year is classified again
+for year in input_years:
+    history.settle(status(year), incremental.current(year, signature(year), outputs(year)))
+
+# deltas of the years classified again are cleared up front, skipped years keep theirs
+if args.delta:
+    delta.clear([x for year in target_years if not unchanged(year) for x in deltas(year) + [changes(year)]])
+
+# settings and reference years a field lookup classifies the target years with, see lookup.fields()
+lookup.record(lookup.SETTINGS, {'entry': entry(''), 'common': None, 'align': None, 'season': seasons['season'],
+ 'compact': args.compact, 'thresholds': thresholds}, {x: refs(x) for x in target_years})
+
+if (args.year or args.resume) and not args.pipeline:
+    skipped = [x for x in target_years if unchanged(x)]
+    target_years = [x for x in target_years if x not in skipped]
+    print("Skipping unchanged years:", skipped, "\n")
+
+# read the next year while classifying the current one and exporting the previous one
+if args.pipeline:
+    with instrument.stage('pipeline'):
+        pipeline.run(ready(), [classify, publish])
+
+# classify years in parallel, each worker writes its own exports
+else:
+    with instrument.stage('classification'):
+        parallel.each(lambda year: publish(classify(year)), sorted(target_years, reverse=True), args.workers)
+
+# count the fallow years, longest fallow run and first and last fallow year of every field across the input years
+if args.history:
+    with instrument.stage('history'):
+        # years exported before their statuses were kept are read back once
+        for year in input_years:
+            if not os.path.exists(status(year)+'.npz') and all(map(os.path.exists, outputs(year))):
+                history.store(status(year), [columnar.read(x, args.output, ['field_status']) for x in names(year)], ['season'])
+        columnar.write(history.table(input_years, [status(x) for x in input_years]), 'output/Nevada_History', args.output)
+
+# fold the loaded years into the multi-year cube, which reads any field's history without loading whole years
+if args.cube:
+    with instrument.stage('cube'):
+        for year in load_years:
+            cube.add('cache/cube32' if args.compact else 'cache/cube', entry(year), year)
+
+# reduce the statuses of every exported season to class counts and fallow fractions per district
+if args.districts:
+    with instrument.stage('districts'):
+        assignment = districts.index('cache/districts', shapefile, centroids)
+        statuses = {(year, season): columnar.read(name, args.output, ['field_status'])['field_status']
+         for year in input_years if all(map(os.path.exists, outputs(year)))
+         for name, season in zip(names(year), ['season'])}
+        if statuses:
+            export(districts.summarize(statuses, assignment), 'output/Nevada_Districts')
 
 # end script time
 end = time.time()
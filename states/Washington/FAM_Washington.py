@@ -13,63 +13,92 @@
 # python_version  : 3.*
 # _________________________________________________________________________________________________________________
 
+import os
+import sys
 import time
 import glob
 
-import numpy as np
 import pandas as pd
 
+# shared routines
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fam import baseline, cache, cli, columnar, compact, crops, cube, delta, districts, features, history, incremental, ingest, instrument, interpolate, lookup, mapping, parallel, pipeline, shards, stream, sweep
+
 # warning handling
 pd.options.mode.chained_assignment = None
 
+# command line options
+args = cli.parse('Washington')
+
+# record wall time, cpu time and memory of every stage to output/Washington_Report.json and .csv
+instrument.begin('output/Washington', args.profile)
+
+# partial writes of an interrupted run, every completed year, baseline and cache entry is kept
+if args.resume:
+    print("Removed", incremental.clean(['cache', 'output']), "partial files of an interrupted run.\n")
+
 # start script time
 start = time.time()
 
-# field status                        cdl
-crp = 5 # cropped                     -> 2
-flw = 4 # fallow                      -> 10
-prn = 3 # perennial, no crop yet      -> 15
-pin = 2 # partially irrigated normal  -> 8
-pop = 1 # partially irrigated poor    -> 9
+# input data paths (raw csvs, or .npz parts inside a shard workspace), crop tables may carry a year in their name
+files = [x for x in glob.glob('input/*/*.csv') + glob.glob('input/*/*.npz') if os.path.dirname(x) != os.path.join('input', 'crop_data')]
 
-# input data paths
-files = [x for x in glob.glob('input/*/*.csv')]
+# legislative districts and field centroids (id, lon, lat) of the district summaries
+shapefile = '../../maps/geospacial/basemaps/wash/cb_2018_53_sldl_500k.shp'
+centroids = '../../maps/geospacial/wa_gps.csv'
 
-# export csv file
-export = lambda df, name: df.to_csv(name + '.csv', header=True)
+if args.districts and not all(map(os.path.exists, [shapefile, centroids])):
+    sys.exit("--districts requires " + shapefile + " and " + centroids)
 
-# smoothing filter
-smooth = lambda df: df.rolling(window=5,min_periods=0,axis=1,center=True).mean()
+# years of input data
+input_years = [2008, 2009, 2010, 2011, 2013, 2014, 2015, 2016, 2017, 2018, 2019]
 
-# create time stamp
-snapshot = lambda start: str(round((time.time() - start)/60,3))
+# historic reference years
+hist_years = args.baseline_years or [2008, 2009, 2010, 2013, 2017]
 
+# years to classify, a targeted run only loads these and the years they depend on
+target_years = args.year or input_years
 
-def decode(field_status):
-    """Maps field status to standard cdl code.
+# export .csv file, written to a temporary file and renamed so an interrupted run leaves no partial file
+export = lambda df, name: cache.write(name + '.csv', lambda f: df.to_csv(f, header=True), 'w')
 
-    Uses a series of vectorized operations to sequentially map input to
-    corresponding cdl code.
+# input data paths by year
+select = lambda year: list(filter(lambda x:str(year) in x, files))
 
-    Args:
-        field_status (ndarray): An array object containing hierarchical
-        field codes.
+# cache entry of a processed year, compact years are kept apart from float64 ones
+entry = lambda year, compact=args.compact: ('cache/yr32_' if compact else 'cache/yr_')+str(year)
 
-    Returns:
-        ndarray: Mapped values to corresponding cdl code.
-    """
-    field_status = np.where(field_status == pin, 8, field_status)
-    field_status = np.where(field_status == pop, 9, field_status)
-    field_status = np.where(field_status == flw, 10, field_status)
-    field_status = np.where(field_status == crp, 2, field_status)
+# cached, processed year
+load = lambda year, compact=args.compact: cache.fetch(entry(year, compact), select(year), year,
+ lambda files, year: process(files, year, compact))
+
+# statuses of a classified year kept for the multi-year history
+status = lambda year: 'cache/status_'+str(year)
+
+# historic reference years of a classified year
+refs = lambda year: baseline.reference(year, input_years, hist_years, args.baseline_trailing, args.baseline_exclude)
+
+# export names of a classified year, .csv files or columnar partitions by state, year and season
+names = lambda year: (['output/Washington_Spring_'+str(year), 'output/Washington_Summer_'+str(year)]
+ if args.output == 'csv' else [columnar.partition('Washington', year, x) for x in ['spring', 'summer']])
+
+# export files of a classified year
+outputs = lambda year: [x+'.'+args.output for x in names(year)]
 
-    # perennials cannot be partially irrigated (summer only)
-    field_status = np.where(field_status == prn, 2, field_status)
+# delta exports and change log of a classified year
+deltas = lambda year: [x.replace('output', os.path.join('output', 'delta'), 1) for x in names(year)]
+changes = lambda year: os.path.join('output', 'delta', 'Washington_Changes_'+str(year))
 
-    return field_status
+# write a classified season in the chosen format, or update rows of an existing export
+save = lambda df, name: columnar.write(df, name, args.output, args.output_mode == 'full')
+update = lambda df, name: columnar.merge(df, name, args.output)
 
+# everything the exports of a classified year depend on
+signature = lambda year: incremental.signature([entry(x) for x in [year]+refs(year)],
+ [os.path.abspath(__file__), crops.source('input/crop_data', year)]) + ':' + args.output_mode
 
-def process(files, year):
+
+def process(files, year, compact=False):
     """Reads, formats, and restructures data.
 
     Uses a series operations to merge multiple .csv files together to format ndvi
@@ -81,247 +110,274 @@ def process(files, year):
 
         year (int): Corresponding year to input data.
 
+        compact (bool): Read float32 ndvi and int32 ids instead of float64 and int64.
+
     Returns:
         DataFrame: A pandas object with properly formatted times series data.
     """
-    df = pd.concat([pd.read_csv(x, usecols=[1,2,3], parse_dates=[2], header=0,
-        names=['ndvi', 'id', 'date']) for x in files])
+    # scatter max observation per id and date into a dense matrix
+    with instrument.stage('ingest', year) as stage:
+        ids, cols, ndvi = ingest.grid(ingest.stream(files, compact, args.threads), year, shards.layout(files))
+        stage['rows'] = len(ids)
 
-    # create any missing observations on 8 day interval for each id
-    dates = pd.date_range("1-01-"+str(year), freq='8D', periods=46)
-    dates = pd.Series(dates.format()).tolist()
-    df = df.append(pd.DataFrame({'ndvi':np.nan,'id':1,'date':dates}), ignore_index=True)
+    with instrument.stage('interpolate', year) as stage:
+        # linearly interpolate by id and constrain data to 8 day intervals
+        df, filled = interpolate.intervals(ids, cols, ndvi, year)
+        stage['rows'] = len(df)
 
-    # merge, sort, and keep max duplicate
-    df = df.sort_values(['id','date','ndvi'])
-    df = df.drop_duplicates(subset=['id','date'], keep='last').iloc[1:]
+    print(year, "interpolation filled", round(filled.mean(), 2), "of 46 values per field.\n")
 
-    # pivot shape for increased efficiency
-    df = df.pivot(index='id', columns='date', values='ndvi')
+    return df
 
-    # linearly interpolate by id
-    df.interpolate(method='linear', axis=1, limit_direction='both', inplace=True)
+# years to load, every year unless a targeted run needs fewer
+load_years = incremental.needed(target_years, refs)
 
-    # constrain data to 8 day intervals
-    df = df[dates].dropna()
+# run field shards one after another with bounded memory, then merge their exports
+if args.shard_size:
+    with instrument.stage('shards'):
+        shards.run(os.path.abspath(__file__), input_years, select, args.shard_size, cli.strip(sys.argv[1:], '--shard-size'))
+    sys.exit()
 
-    return df
+# fold newly arrived files into their cached years in place, keeping the fields that changed
+streamed = {}
+if args.append:
+    appended = [os.path.normpath(x) for x in args.append]
+    for year in target_years:
+        new = [x for x in select(year) if os.path.normpath(x) in appended]
+        with instrument.stage('stream', year):
+            streamed[year] = stream.append(entry(year), select(year), new, year, args.compact, args.threads)
 
-print("Processing initiated at",snapshot(start),"minutes.\n")
-
-try:
-    yr_2008 = pd.read_csv("cache/yr_2008.csv").set_index('id')
-    yr_2009 = pd.read_csv("cache/yr_2009.csv").set_index('id')
-    yr_2010 = pd.read_csv("cache/yr_2010.csv").set_index('id')
-    yr_2011 = pd.read_csv("cache/yr_2011.csv").set_index('id')
-    yr_2013 = pd.read_csv("cache/yr_2013.csv").set_index('id')
-    yr_2014 = pd.read_csv("cache/yr_2014.csv").set_index('id')
-    yr_2015 = pd.read_csv("cache/yr_2015.csv").set_index('id')
-    yr_2016 = pd.read_csv("cache/yr_2016.csv").set_index('id')
-    yr_2017 = pd.read_csv("cache/yr_2017.csv").set_index('id')
-    yr_2018 = pd.read_csv("cache/yr_2018.csv").set_index('id')
-    yr_2019 = pd.read_csv("cache/yr_2019.csv").set_index('id')
-
-except:
-    print("Exception: year not found.")
-    yr_2008 = process(list(filter(lambda x:'2008' in x, files)), 2008)
-    yr_2009 = process(list(filter(lambda x:'2009' in x, files)), 2009)
-    yr_2010 = process(list(filter(lambda x:'2010' in x, files)), 2010)
-    yr_2011 = process(list(filter(lambda x:'2011' in x, files)), 2011)
-    yr_2013 = process(list(filter(lambda x:'2013' in x, files)), 2013)
-    yr_2014 = process(list(filter(lambda x:'2014' in x, files)), 2014)
-    yr_2015 = process(list(filter(lambda x:'2015' in x, files)), 2015)
-    yr_2016 = process(list(filter(lambda x:'2016' in x, files)), 2016)
-    yr_2017 = process(list(filter(lambda x:'2017' in x, files)), 2017)
-    yr_2018 = process(list(filter(lambda x:'2018' in x, files)), 2018)
-    yr_2019 = process(list(filter(lambda x:'2019' in x, files)), 2019)
-
-    export(yr_2008, "cache/yr_2008")
-    export(yr_2009, "cache/yr_2009")
-    export(yr_2010, "cache/yr_2010")
-    export(yr_2011, "cache/yr_2011")
-    export(yr_2013, "cache/yr_2013")
-    export(yr_2014, "cache/yr_2014")
-    export(yr_2015, "cache/yr_2015")
-    export(yr_2016, "cache/yr_2016")
-    export(yr_2017, "cache/yr_2017")
-    export(yr_2018, "cache/yr_2018")
-    export(yr_2019, "cache/yr_2019")
-
-print("Processing completed at",snapshot(start),"minutes.\n")
-
-print("Historic calculations initiated at",snapshot(start),"minutes.\n")
-
-# historic years
-hist_years = [yr_2008, yr_2009, yr_2010, yr_2013, yr_2017]
-
-# calculate 5 year maximums for smoothed ts
-max_smooth_spring = np.array([smooth(df.iloc[:,8:19]).max(axis=1) for df in hist_years]).max(0)
-max_smooth_overlap = np.array([smooth(df.iloc[:,12:23]).max(axis=1) for df in hist_years]).max(0)
-max_smooth_summer = np.array([smooth(df.iloc[:,19:38]).max(axis=1) for df in hist_years]).max(0)
-
-max_smooth_5yr = pd.DataFrame({'id': yr_2018.index.values, 'spring_ndvi_smoothed_5yr_max':
- max_smooth_spring,'overlap_ndvi_smoothed_5yr_max': max_smooth_overlap,
- 'summer_ndvi_smoothed_5yr_max': max_smooth_summer}).set_index('id')
-
-print("Historic calculations completed at",snapshot(start),"minutes.\n")
+# years processed up front, a pipelined run reads them while classifying
+ahead = [] if args.pipeline else load_years
 
-# variables to tune
-ndvi_max_threshold = 0.55
-ndvi_min_threshold = 0.4
-ndvi_perc_historic_threshold1 = 0.7
-ndvi_perc_historic_threshold2 = 0.5
-perennial_date_threshold = 23
+# process years in parallel, results are handed back through the memory-mapped cache
+with instrument.stage('process'):
+    parallel.each(load, ahead, args.workers)
 
-# crop type information for perennials (id's may change with alteration of field boundaries)
-crop_type = pd.read_csv("input/crop_data/perennial.csv").set_index('id')
+# load each year from the binary cache, rebuilding only those with changed inputs
+with instrument.stage('cache_load') as stage:
+    years = {year: load(year) for year in ahead}
+    stage['rows'] = sum(len(x) for x in years.values())
 
-# ________________________________________DATE CONVERSION_________________________________________
-#|01-01|01-09|01-17|01-25|02-02|02-10|02-18|02-26|03-06|03-14|03-22|03-30|04-07|04-15|04-23|05-01|
-#|  0  |  1  |  2  |  3  |  4  |  5  |  6  |  7  |  8  |  9  |  10 |  11 |  12 |  13 |  14 |  15 |
-#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
-#|05-09|05-17|05-25|06-02|06-10|06-18|06-26|07-04|07-12|07-20|07-28|08-05|08-13|08-21|08-29|09-06|
-#|  16 |  17 |  18 |  19 |  20 |  21 |  22 |  23 |  24 |  25 |  26 |  27 |  28 |  29 |  30 |  31 |
-#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
-#|09-14|09-22|09-30|10-08|10-16|10-24|11-01|11-09|11-17|11-25|12-03|12-11|12-19|12-27|     |     |
-#|  32 |  33 |  34 |  35 |  36 |  37 |  38 |  39 |  40 |  41 |  42 |  43 |  44 |  45 |     |     |
-#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
+# store smoothed season maxima of every loaded year once, baselines are derived from these tables
+with instrument.stage('baseline'):
+    parallel.each(lambda year: baseline.table(entry(year)), ahead, args.workers)
 
 
-def fallowMapping(df, season):
-    """Performs initial classification results by season.
+def historic(year, ids, compact=args.compact):
+    """Calculates historic maximums for smoothed ts.
 
-    Applies a series of rules to periods of the data partitioned by season. Rules
-    perform vectorized operations and are detailed in the comments. Assigned
-    field statuses are hierarchical in nature and must be later converted to
-    their respective cdl codes.
+    Takes the highest smoothed value per season over the reference years of a
+    classified year from the stored tables, joined by id.
 
     Args:
-        df (DataFrame): A pandas object which contains formatted ndvi time
-                        series data.
+        year (int): The year being classified.
 
-        season (str): A season either "spring", "summer", or "overlap".
+        ids (Index): Field ids of the classified year.
+
+        compact (bool): Derive the maximums from the compact cache entries.
 
     Returns:
-        DataFrame: A pandas object with classified times series data.
+        DataFrame: A pandas object indexed by id with the historic maximum of
+                   each season.
     """
-    if(season == 'spring'):
-        df = df.iloc[:,8:19]
-        hist_season = 'spring_ndvi_smoothed_5yr_max'
-
-    elif(season == 'overlap'):
-        df = df.iloc[:,12:23]
-        hist_season = 'overlap_ndvi_smoothed_5yr_max'
-
-    elif(season == 'summer'):
-        df = df.iloc[:,19:38]
-        hist_season = 'summer_ndvi_smoothed_5yr_max'
+    with instrument.stage('baseline_derive', year):
+        return baseline.derive([entry(x, compact) for x in refs(year)], ids)
 
-    df_smooth = pd.DataFrame(np.sort(smooth(df).values, axis=1), index=df.index, columns=df.columns)
-    df_sorted = pd.DataFrame(np.sort(df.values, axis=1), index=df.index, columns=df.columns)
-
-    # highest ndvi values from the original linearly interpolated ts
-    ndvi_max1 = df_sorted.iloc[:,-1]
-    ndvi_max4 = df_sorted.iloc[:,-4]
-
-    # highest ndvi values from the smoothed ts
-    ndvi_smoothed_max1 = df_smooth.iloc[:,-1]
+# variables to tune
+ndvi_max_threshold = 0.55
+ndvi_min_threshold = 0.4
+ndvi_perc_historic_threshold1 = 0.7
+ndvi_perc_historic_threshold2 = 0.5
+perennial_date_threshold = 23
 
-    # check cropped
-    rule1 = np.where(ndvi_max4 >= ndvi_max_threshold, crp, -9999)
+# thresholds by name, as the shared fallow mapping rules and the sweep take them
+thresholds = {'ndvi_max_threshold': ndvi_max_threshold, 'ndvi_min_threshold': ndvi_min_threshold,
+ 'ndvi_perc_historic_threshold1': ndvi_perc_historic_threshold1, 'ndvi_perc_historic_threshold2': ndvi_perc_historic_threshold2}
 
-    # mask for perennial croptype (summer only)
-    rule2 = np.where(crop_type['crop_group'].notnull(), prn, -9999)
+# crop type information for perennials (id's may change with alteration of field boundaries), a year may have its
+# own perennial_<year>.csv table, each table is compiled once into a binary cache of ids and crop group codes
+crop_table = lambda year: crops.table(crops.source('input/crop_data', year))
 
-    # check fallow
-    rule3 = np.where(ndvi_max1 < ndvi_min_threshold, flw, -9999)
+# perennial crop mask of a year, gathered by id onto its fields
+perennial_mask = lambda df, year: crops.mask(crop_table(year), df.index.values)
 
-    # check fields between 0.4 and 0.7 relative to historic average
-    rule4 = np.where(ndvi_smoothed_max1 >= (ndvi_perc_historic_threshold1
-     * max_smooth_5yr[hist_season]), pin, -9999)
+def tune(year):
+    """Evaluates the threshold combinations of the sweep on a single year.
 
-    # check for partially irrigated
-    rule5 = np.where(ndvi_smoothed_max1 >= (ndvi_perc_historic_threshold2
-     * max_smooth_5yr[hist_season]), pop, -9999)
+    Args:
+        year (int): Year to evaluate.
+    """
+    df, hist = years[year], historic(year, years[year].index)
+    feats = features.seasons(df.values)
+    area = sweep.areas(args.sweep_area, df.index) if args.sweep_area else None
+    hist = {x: hist[x].values for x in ['spring', 'overlap', 'summer']}
 
-    # check for fields that are less than 50% of historical average
-    rule6 = np.where(ndvi_smoothed_max1 < (ndvi_perc_historic_threshold2
-     * max_smooth_5yr[hist_season]), flw, -9999)
+    with instrument.stage('tune', year):
+        export(sweep.sweep(feats, hist, combos, perennial_mask(df, year), area, split=19),
+         'output/Washington_Sweep_'+str(year))
 
-    # calculate percent 5 year average
-    pnorm = np.where(True,round(ndvi_smoothed_max1/max_smooth_5yr[hist_season],4)*100,-9999)
+# evaluate a grid of thresholds on the features of each year instead of classifying
+if args.sweep:
+    combos = sweep.read(args.sweep, thresholds)
 
-    # classify field status via hierarchical merge
-    if(season == 'summer'):
-        field_status = np.maximum.reduce([rule1, rule2, rule3, rule4, rule5, rule6])
-    else:
-        field_status = np.maximum.reduce([rule1, rule3, rule4, rule5, rule6])
+    print("Sweeping", len(combos), "threshold combinations.\n")
+    with instrument.stage('sweep'):
+        parallel.each(tune, target_years, args.workers)
+    sys.exit()
 
-    # add classifications & historical averages
-    df.insert(0,'field_status',field_status)
-    df.insert(0,'percent_5yr_Avg',pnorm)
+def check(year, fam):
+    """Compares the compact classification of a year with the float64 path.
 
-    return df
+    Args:
+        year (int): The year being classified.
 
+        fam (list): Compact classified seasons of the year.
+    """
+    df = load(year, False)
+    ref = mapping.postProcess(df, historic(year, df.index, False), thresholds, perennial_mask(df, year))
 
-def postProcess(yr_df):
-    """Performs final classification on results.
+    export(compact.report(ref, fam, ['spring', 'summer']),'output/Washington_Compact_'+str(year))
 
-    Compares the date of the max ndvi value with cropped observations in the overlap
-    period to reclassify observations as cropped. Calls decoding function on encoded
-    statuses to proper cdl standards. Calls fallowMapping for initial classifications.
+def classify(year):
+    """Classifies a single year.
 
     Args:
-        yr_df (DataFrame): A pandas object which contains formatted ndvi time
-                           series data.
+        year (int): Year to classify.
 
     Returns:
-        list: Contains two pandas DataFrame objects by season with final classified
-              results.
+        tuple: The year, its classified seasons and the function writing them.
     """
-    print("Initial classifications initiated at",snapshot(start),"minutes.\n")
+    df, hist = years[year], historic(year, years[year].index)
+    perennial = perennial_mask(df, year)
 
-    # initial classifications
-    df_spring = fallowMapping(yr_df,'spring')
-    df_overlap = fallowMapping(yr_df,'overlap')
-    df_summer = fallowMapping(yr_df,'summer')
+    # after a streamed update only fields whose series changed are classified again
+    rows, write = slice(None), save
+    if streamed.get(year) is not None and all(os.path.exists(x) for x in outputs(year)):
+        rows, write = df.index.isin(streamed[year]), update
 
-    print("Initial classifications completed at",snapshot(start),"minutes.\n")
+    with instrument.stage('classify', year) as stage:
+        fam = mapping.postProcess(df[rows], hist[rows], thresholds, perennial[rows])
+        stage['rows'] = len(fam[0])
 
-    # mask of cropped observations in overlap period
-    mask_ov = np.where(df_overlap['field_status'] == crp,7,-1)
+    # compact exports carry int16 statuses and float32 values
+    if args.compact:
+        fam = [compact.shrink(x) for x in fam]
 
-    # date of max ndvi
-    a = list(smooth(yr_df).idxmax(axis=1))
-    # spring date columns
-    b = list(yr_df.iloc[:,0:19].columns)
-    # summer date columns
-    c = list(yr_df.iloc[:,19:].columns)
+    return year, fam, write
 
-    # check if max ndvi value is in season
-    mask_sp = [7 if i in b else 0 for i in a]
-    mask_su = [7 if i in c else 0 for i in a]
+def publish(result):
+    """Exports a classified year and stamps it as up to date.
 
-    # max ndvi observation and cropped in overlap period
-    df_spring['field_status'] = decode(np.where(mask_sp == mask_ov, crp, df_spring['field_status']))
-    df_summer['field_status'] = decode(np.where(mask_su == mask_ov, crp, df_summer['field_status']))
+    Args:
+        result (tuple): Output of classify().
+    """
+    year, fam, write = result
+
+    with instrument.stage('export', year):
+        write(fam[0],names(year)[0])
+        write(fam[1],names(year)[1])
 
-    # mask for early season perennials (spring only)
-    df_spring['field_status'] = np.where(crop_type['crop_group'].notnull(), 15, df_spring['field_status'])
+        # rows whose status changed since the previous export, compared before the statuses are replaced
+        if args.delta:
+            rows, log = delta.diff(history.vector(status(year)), fam, ['spring', 'summer'], write is update)
+            for df, name in zip(rows, deltas(year)):
+                save(df, name)
+            columnar.write(log, changes(year), args.output)
 
-    return [df_spring, df_summer]
+        history.store(status(year), fam, ['spring', 'summer'], write is update, staged=True)
 
+    if args.compact_report:
+        with instrument.stage('compact_report', year):
+            check(year, fam)
+    incremental.mark(year, signature(year))
 
-print("Post-processing initiated at",snapshot(start),"minutes.\n")
+    # the statuses become the base of the next delta only once the year is stamped
+    history.settle(status(year), True)
 
-years = [yr_2019, yr_2018, yr_2017, yr_2016, yr_2015, yr_2014, yr_2013, yr_2011, yr_2010, yr_2009, yr_2008]
-for year in years:
-    fam = postProcess(year)
-    name = [x for x in globals() if globals()[x] is year][0]
-    export(fam[0],'output/Washington_Spring_'+name[3:7])
-    export(fam[1],'output/Washington_Summer_'+name[3:7])
+    # release the year, a pipelined run only holds the few years in flight
+    years.pop(year, None)
 
-print("Post-processing & exports completed at",snapshot(start),"minutes.\n")
+def ready():
+    """Reads years in the order the classified years need them.
+
+    Yields:
+        int: Each year to classify, once it and its reference years are read.
+    """
+    for year, released in pipeline.order(sorted(target_years, reverse=True), lambda x: [x]+refs(x)):
+        with instrument.stage('read', year):
+            df = load(year)
+            baseline.table(entry(year))
+            if year in target_years:
+                years[year] = df
+
+        for x in released:
+            if unchanged(x):
+                print("Skipping unchanged year:", x, "\n")
+                years.pop(x, None)
+                continue
+            yield x
+
+# float64 years the compact classification is compared against, cached before the workers read them
+if args.compact_report:
+    with instrument.stage('compact_reference'):
+        parallel.each(lambda year: load(year, False), load_years, args.workers)
+        parallel.each(lambda year: baseline.table(entry(year, False)), load_years, args.workers)
+
+# a targeted or resumed run skips years exported from the same inputs, baseline and script
+unchanged = lambda year: (args.year or args.resume) and incremental.current(year, signature(year), outputs(year))
+
+# statuses staged by an interrupted export are kept if it was stamped, otherwise the year is classified again
+for year in input_years:
+    history.settle(status(year), incremental.current(year, signature(year), outputs(year)))
+
+# deltas of the years classified again are cleared up front, skipped years keep theirs
+if args.delta:
+    delta.clear([x for year in target_years if not unchanged(year) for x in deltas(year) + [changes(year)]])
+
+# settings and reference years a field lookup classifies the target years with, see lookup.fields()
+lookup.record(lookup.SETTINGS, {'entry': entry(''), 'common': None, 'align': None, 'season': None,
+ 'compact': args.compact, 'thresholds': thresholds}, {x: refs(x) for x in target_years})
+
+if (args.year or args.resume) and not args.pipeline:
+    skipped = [x for x in target_years if unchanged(x)]
+    target_years = [x for x in target_years if x not in skipped]
+    print("Skipping unchanged years:", skipped, "\n")
+
+# read the next year while classifying the current one and exporting the previous one
+if args.pipeline:
+    with instrument.stage('pipeline'):
+        pipeline.run(ready(), [classify, publish])
+
+# classify years in parallel, each worker writes its own exports
+else:
+    with instrument.stage('classification'):
+        parallel.each(lambda year: publish(classify(year)), sorted(target_years, reverse=True), args.workers)
+
+# count the fallow years, longest fallow run and first and last fallow year of every field across the input years
+if args.history:
+    with instrument.stage('history'):
+        # years exported before their statuses were kept are read back once
+        for year in input_years:
+            if not os.path.exists(status(year)+'.npz') and all(map(os.path.exists, outputs(year))):
+                history.store(status(year), [columnar.read(x, args.output, ['field_status']) for x in names(year)], ['spring', 'summer'])
+        columnar.write(history.table(input_years, [status(x) for x in input_years]), 'output/Washington_History', args.output)
+
+# fold the loaded years into the multi-year cube, which reads any field's history without loading whole years
+if args.cube:
+    with instrument.stage('cube'):
+        for year in load_years:
+            cube.add('cache/cube32' if args.compact else 'cache/cube', entry(year), year)
+
+# reduce the statuses of every exported season to class counts and fallow fractions per district
+if args.districts:
+    with instrument.stage('districts'):
+        assignment = districts.index('cache/districts', shapefile, centroids)
+        statuses = {(year, season): columnar.read(name, args.output, ['field_status'])['field_status']
+         for year in input_years if all(map(os.path.exists, outputs(year)))
+         for name, season in zip(names(year), ['spring', 'summer'])}
+        if statuses:
+            export(districts.summarize(statuses, assignment), 'output/Washington_Districts')
 
 # end script time
 end = time.time()
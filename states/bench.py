@@ -0,0 +1,306 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : bench.py
+# description     : Benchmark suite of the F.A.M. pipeline. Synthetic states of increasing size are generated and
+#                   every stage (ingest, interpolation, cache, alignment, baseline, features, classification
+#                   and export) is timed and memory-profiled, optionally followed by a full run of a
+#                   state script. Results are stored as .json files that can be compared between versions.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+#                   Example: python bench.py --fields 10000,100000,1000000 --compare bench/baseline.json
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import sys
+import ast
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from fam import align, baseline, cache, columnar, features, ingest, interpolate, mapping, shards, synthetic
+
+# directory containing the state folders
+root = os.path.dirname(os.path.abspath(__file__))
+
+# default thresholds of the state scripts
+thresholds = {'ndvi_max_threshold': 0.55, 'ndvi_min_threshold': 0.4, 'ndvi_perc_historic_threshold1': 0.7,
+    'ndvi_perc_historic_threshold2': 0.5}
+
+# stages shorter than this are ignored when comparing runs, their timings are mostly noise
+floor = 0.05
+
+
+def memory(reset=False):
+    """Reads the resident memory of this process.
+
+    Args:
+        reset (bool): Reset the peak to the current resident memory first.
+
+    Returns:
+        tuple: Current and peak resident memory in MB, None where /proc is
+               not available.
+    """
+    try:
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        with open('/proc/self/status') as f:
+            status = dict(x.split(':', 1) for x in f)
+    except OSError:
+        return None, None
+
+    return tuple(int(status[x].split()[0]) / 2**10 for x in ['VmRSS', 'VmHWM'])
+
+
+def measure(records, stage, fields, fn, year=None, rows=None):
+    """Runs a stage and records its wall time, cpu time and memory use.
+
+    The peak resident memory is reset before the stage, so the recorded peak
+    is the memory the stage needed on top of what was held before.
+
+    Args:
+        records (list): Receives one dict per stage.
+
+        stage (str): Name of the stage.
+
+        fields (int): Number of fields of the benchmark.
+
+        fn (function): The stage, called without arguments.
+
+        year (int): Year the stage worked on, if any.
+
+        rows (function): Optional, returns the number of rows handled from
+                         the result of fn.
+
+    Returns:
+        object: The result of fn.
+    """
+    before, _ = memory(reset=True)
+    wall, cpu = time.perf_counter(), time.process_time()
+
+    out = fn()
+
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    _, peak = memory()
+
+    records.append({'fields': fields, 'stage': stage, 'year': year, 'seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4), 'peak_mb': None if peak is None else round(peak - before, 2),
+        'rss_mb': None if peak is None else round(peak, 2), 'rows': None if rows is None else int(rows(out))})
+
+    return out
+
+
+def process(files, year):
+    """Formats a year with the ingest and interpolation steps of the state scripts.
+
+    Args:
+        files (list): A list of .csv files.
+
+        year (int): Corresponding year to input data.
+
+    Returns:
+        DataFrame: A pandas object with properly formatted times series data.
+    """
+    ids, cols, ndvi = ingest.grid(ingest.stream(files), year, shards.layout(files))
+
+    return interpolate.intervals(ids, cols, ndvi, year)[0]
+
+
+def pipeline(folder, n, years, files, records):
+    """Benchmarks every stage on a synthetic state.
+
+    Every year but the last serves as historic reference of the last year,
+    which is classified and exported.
+
+    Args:
+        folder (str): Working directory of the synthetic state.
+
+        n (int): Number of fields.
+
+        years (list): Years of input data.
+
+        files (int): Number of .csv files per year.
+
+        records (list): Receives the measurements.
+    """
+    profile = measure(records, 'generate', n, lambda: synthetic.tree(folder, years, n, files), rows=len)
+    entry = lambda year: os.path.join(folder, 'cache', 'yr_'+str(year))
+    select = lambda year: sorted(os.path.join(folder, 'input', str(year), x)
+        for x in os.listdir(os.path.join(folder, 'input', str(year))))
+
+    data = {}
+    for year in years:
+        parts = measure(records, 'ingest', n, lambda: ingest.load(select(year)), year,
+            lambda x: sum(len(p[0]) for p in x))
+        grid = measure(records, 'scatter', n, lambda: ingest.grid(parts, year), year, lambda x: len(x[0]))
+        del parts, grid
+
+        df = measure(records, 'process', n, lambda: process(select(year), year), year, len)
+        key = cache.fingerprint(select(year))
+        measure(records, 'cache_store', n, lambda: cache.store(entry(year), key, df), year)
+        data[year] = measure(records, 'cache_load', n, lambda: cache.load(entry(year), key), year, len)
+
+    common = measure(records, 'align', n, lambda: align.index(os.path.join(folder, 'cache', 'common'),
+        [entry(x) for x in years]), rows=len)
+    data = measure(records, 'align_take', n, lambda: {x: align.take(df, common) for x, df in data.items()},
+        rows=lambda x: sum(len(df) for df in x.values()))
+
+    year = years[-1]
+    df = data[year]
+    for x in years:
+        measure(records, 'baseline_table', n, lambda: baseline.table(entry(x)), x)
+    hist = measure(records, 'baseline_derive', n, lambda: baseline.derive([entry(x) for x in years[:-1]], df.index),
+        year, len)
+
+    feats = measure(records, 'features', n, lambda: features.seasons(df.values), year, lambda x: len(df))
+
+    # the fallow mapping rules and post-processing of the state scripts
+    perennial = profile['crop_group'].reindex(df.index).notnull().values
+    final = measure(records, 'classify', n, lambda: mapping.postProcess(df, hist, thresholds, perennial), year,
+        lambda x: len(x[0]))
+
+    def export():
+        for season, out in zip(['spring', 'summer'], final):
+            columnar.write(out, os.path.join(folder, 'output', 'Synthetic_'+season.title()+'_'+str(year)))
+
+    measure(records, 'export', n, export, year, lambda x: 2*len(df))
+
+
+def script(folder, state, n, files, records, argv=()):
+    """Benchmarks a full run of a state script on a synthetic state.
+
+    The input years are read from the script. Time and peak memory are those
+    of the script's own process.
+
+    Args:
+        folder (str): Working directory of the synthetic state.
+
+        state (str): State name, e.g. "California".
+
+        n (int): Number of fields.
+
+        files (int): Number of .csv files per year.
+
+        records (list): Receives the measurement.
+
+        argv (list): Options passed on to the script.
+    """
+    path = os.path.join(root, state, 'FAM_'+state+'.py')
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    years = next(ast.literal_eval(x.value) for x in tree.body if isinstance(x, ast.Assign)
+        and getattr(x.targets[0], 'id', None) == 'input_years')
+
+    synthetic.tree(folder, years, n, files)
+
+    wall = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, path] + list(argv), cwd=folder, stdout=subprocess.DEVNULL)
+    pid, code, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - wall
+
+    if code:
+        raise RuntimeError(state + " script failed on " + str(n) + " fields")
+
+    records.append({'fields': n, 'stage': 'script_'+state, 'year': None, 'seconds': round(wall, 4),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 4), 'peak_mb': None,
+        'rss_mb': round(usage.ru_maxrss / 2**10, 2), 'rows': n})
+
+
+def compare(records, path, tolerance):
+    """Compares measurements with those of an earlier run.
+
+    Args:
+        records (list): Measurements of this run.
+
+        path (str): .json file of the earlier run.
+
+        tolerance (float): Largest accepted ratio of time or memory.
+
+    Returns:
+        DataFrame: Stages measured in both runs with their ratios and whether
+                   they regressed.
+    """
+    with open(path) as f:
+        old = pd.DataFrame(json.load(f)['records'])
+    new = pd.DataFrame(records)
+
+    # stage times are summed over the years of a run
+    total = lambda df: df.groupby(['fields', 'stage']).agg(seconds=('seconds', 'sum'), rss_mb=('rss_mb', 'max'))
+    out = total(old).join(total(new), lsuffix='_old', rsuffix='_new', how='inner')
+
+    out['time_ratio'] = out['seconds_new'] / out['seconds_old']
+    out['rss_ratio'] = out['rss_mb_new'] / out['rss_mb_old']
+    out['regressed'] = (((out['time_ratio'] > tolerance) & (out['seconds_new'] > floor))
+        | (out['rss_ratio'] > tolerance))
+
+    return out
+
+
+if __name__ == '__main__':
+    start = time.time()
+
+    parser = argparse.ArgumentParser(description="Benchmarks the F.A.M. pipeline on synthetic states.")
+    parser.add_argument('--fields', type=lambda x: [int(float(y)) for y in x.split(',') if y], default=[10000, 100000],
+        help="comma separated numbers of fields, e.g. 10000,100000,1e6,5e6 (default: 10000,100000)")
+    parser.add_argument('--years', type=lambda x: [int(y) for y in x.split(',') if y], default=[2017, 2018, 2019],
+        help="synthetic years, the last is classified against the others (default: 2017,2018,2019)")
+    parser.add_argument('--files', type=int, default=4, help="raw .csv files per year (default: 4)")
+    parser.add_argument('--script', action='append', default=[],
+        help="also time a full run of this state's script, may be repeated")
+    parser.add_argument('--label', default=None, help="name of the results (default: the current git commit)")
+    parser.add_argument('--out', default=os.path.join(root, 'bench'), help="folder of the results (default: bench)")
+    parser.add_argument('--workdir', default=None, help="folder of the synthetic data (default: a temporary folder)")
+    parser.add_argument('--keep', action='store_true', help="keep the synthetic data")
+    parser.add_argument('--compare', default=None, help=".json results of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+        help="largest accepted ratio of time or peak memory when comparing (default: 1.25)")
+    args, extra = parser.parse_known_args()
+
+    label = args.label
+    if label is None:
+        git = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True, text=True)
+        label = git.stdout.strip() or time.strftime('%Y%m%d-%H%M%S')
+
+    work = args.workdir or tempfile.mkdtemp(prefix='fam_bench_')
+    records = []
+
+    try:
+        for n in args.fields:
+            print("Benchmarking", n, "fields.\n", flush=True)
+            pipeline(os.path.join(work, 'pipeline_'+str(n)), n, args.years, args.files, records)
+
+            for state in args.script:
+                script(os.path.join(work, state+'_'+str(n)), state, n, args.files, records, extra)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    results = {'label': label, 'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+        'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count(),
+        'records': records}
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, label+'.json')
+    cache.write(path, lambda f: json.dump(results, f, indent=1), 'w')
+
+    summary = pd.DataFrame(records).groupby(['fields', 'stage'], sort=False).agg(seconds=('seconds', 'sum'),
+        cpu_seconds=('cpu_seconds', 'sum'), peak_mb=('peak_mb', 'max'), rss_mb=('rss_mb', 'max'))
+    print(summary.to_string(), "\n")
+    print("Results written to", path, "\n")
+
+    code = 0
+    if args.compare:
+        diff = compare(records, args.compare, args.tolerance)
+        print(diff[['seconds_old', 'seconds_new', 'time_ratio', 'rss_ratio', 'regressed']].round(3).to_string(), "\n")
+        code = int(diff['regressed'].any())
+
+    print("Total time to run benchmark:", str(round((time.time()-start)/60,3)), "minutes.\n")
+
+    sys.exit(code)
@@ -0,0 +1,8 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : fam
+# description     : Shared routines used by the state level F.A.M. scripts (FAM_<State>.py). Each script adds the
+#                   parent directory to its path and imports the modules it needs from this package.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
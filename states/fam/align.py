@@ -0,0 +1,93 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : align.py
+# description     : Field id alignment across years. The common (or combined) field set of several cached years is
+#                   computed once from their sorted id vectors, kept in the cache next to the years it was derived
+#                   from, and every year or table is then gathered onto it with a single take.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import hashlib
+import functools
+
+import numpy as np
+
+from fam import cache
+
+
+def ids(paths, how='intersection'):
+    """Combines the field ids of cached years.
+
+    Args:
+        paths (list): Cache entry prefixes of the years.
+
+        how (str): Either "intersection" for the fields found in every year
+                   or "union" for the fields found in any year.
+
+    Returns:
+        ndarray: The sorted field ids.
+    """
+    if how == 'intersection':
+        combine = lambda a, b: np.intersect1d(a, b, assume_unique=True)
+    else:
+        combine = np.union1d
+
+    return functools.reduce(combine, [np.load(x + '.id.npy') for x in paths])
+
+
+def index(path, paths, how='intersection'):
+    """Loads an id alignment index, computing it only when its years change.
+
+    Args:
+        path (str): Cache prefix of the index, e.g. "cache/common".
+
+        paths (list): Cache entry prefixes of the years.
+
+        how (str): Either "intersection" or "union", see ids().
+
+    Returns:
+        ndarray: The sorted field ids.
+    """
+    h = hashlib.sha1(how.encode())
+    for x in paths:
+        h.update((x + '=' + str(cache.key(x))).encode())
+    key = h.hexdigest()
+
+    try:
+        with np.load(path + '.npz') as f:
+            if str(f['key']) == key:
+                return f['id']
+    except (OSError, KeyError, ValueError):
+        pass
+
+    out = ids(paths, how)
+    cache.write(path + '.npz', lambda f: np.savez(f, key=key, id=out))
+
+    return out
+
+
+def take(df, ids):
+    """Gathers the rows of a table onto aligned field ids.
+
+    Ids missing from the table are left out, so a year is limited to its
+    own fields within the aligned set.
+
+    Args:
+        df (DataFrame): A pandas object indexed by id.
+
+        ids (ndarray): Sorted field ids as returned by index().
+
+    Returns:
+        DataFrame: The rows of the ids found in df, in their sorted order.
+    """
+    # sorted ids are located by binary search, any other order by hashing
+    index = df.index.values
+    if df.index.is_monotonic_increasing and len(index):
+        pos = np.searchsorted(index, ids).clip(0, len(index)-1)
+        pos = pos[index[pos] == ids]
+    else:
+        pos = df.index.get_indexer(ids)
+        pos = pos[pos >= 0]
+
+    return df.iloc[pos]
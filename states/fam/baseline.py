@@ -0,0 +1,178 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : baseline.py
+# description     : Persistent store of per field smoothed season maxima. Every cached year gets a small table of
+#                   its smoothed maxima per season, computed once and kept next to the cache entry, from which any
+#                   historic baseline (fixed reference years, a trailing window, drought years excluded) is derived
+#                   with a reduction joined by id, without loading the full year matrices again. Tables are
+#                   memory-mapped, so the baseline of a few fields only reads their rows.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from fam import cache, features
+
+# suffixes of the per year table of smoothed season maxima, one row per field of the cache entry, and its key
+SUFFIX = '.maxima.npy'
+KEY = '.maxima.json'
+
+
+def store(path, key, maxima):
+    """Writes the table of a cached year.
+
+    The key is removed first and written last so that an interrupted write
+    is never mistaken for a valid table.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        key (str): Fingerprint of the cache entry the table belongs to.
+
+        maxima (ndarray): The fields x seasons smoothed maxima.
+    """
+    if os.path.exists(path + KEY):
+        os.remove(path + KEY)
+
+    cache.write(path + SUFFIX, lambda f: np.save(f, np.ascontiguousarray(maxima)))
+    cache.write(path + KEY, lambda f: json.dump({'key': key}, f), 'w')
+
+
+def values(path):
+    """Maps the smoothed season maxima of a cached year into memory.
+
+    The table is computed from the cached year the first time it is needed and
+    again only when the cache entry is rebuilt.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+    Returns:
+        tuple: Sorted field ids (ndarray) and their fields x seasons maxima
+               (ndarray), both memory-mapped, in the order of SEASONS.
+    """
+    key = cache.key(path)
+
+    try:
+        with open(path + KEY) as f:
+            if json.load(f)['key'] == key:
+                return np.load(path + '.id.npy', mmap_mode='r'), np.load(path + SUFFIX, mmap_mode='r')
+    except (OSError, KeyError, ValueError):
+        pass
+
+    df = cache.load(path)
+    feats = features.seasons(df.values)
+    maxima = np.column_stack([feats[x]['ndvi_smoothed_max1'] for x in features.SEASONS])
+
+    store(path, key, maxima)
+
+    return np.asarray(df.index.values), maxima
+
+
+def table(path):
+    """Reads the smoothed season maxima of a cached year.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+    Returns:
+        DataFrame: A pandas object indexed by id with one column per season.
+    """
+    ids, maxima = values(path)
+
+    return pd.DataFrame(np.asarray(maxima), index=pd.Index(ids, name='id'), columns=list(features.SEASONS))
+
+
+def patch(path, key, ids, ndvi):
+    """Updates the table of a cached year for a few changed fields.
+
+    Only a table matching the current cache entry is patched, any other is
+    left to be recomputed by table().
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        key (str): Fingerprint the cache entry is about to be rekeyed to.
+
+        ids (ndarray): Sorted ids of the changed fields.
+
+        ndvi (ndarray): Their new fields x 46 dates ndvi matrix.
+    """
+    try:
+        with open(path + KEY) as f:
+            if json.load(f)['key'] != cache.key(path):
+                return
+        maxima = np.load(path + SUFFIX)
+        id_ = np.load(path + '.id.npy')
+    except (OSError, KeyError, ValueError):
+        return
+
+    pos = np.searchsorted(id_, ids).clip(0, len(id_)-1)
+    found = id_[pos] == ids
+
+    feats = features.seasons(ndvi[found])
+    maxima[pos[found]] = np.column_stack([feats[x]['ndvi_smoothed_max1'] for x in features.SEASONS])
+
+    store(path, key, maxima)
+
+
+def reference(year, available, fixed, trailing=0, exclude=()):
+    """Selects the historic reference years used for a classified year.
+
+    Args:
+        year (int): The year being classified.
+
+        available (list): Years with input data.
+
+        fixed (list): Reference years used when no trailing window is set.
+
+        trailing (int): If set, the most recent number of available years
+                        before the classified year are used instead.
+
+        exclude (list): Years never used as reference, e.g. drought years.
+
+    Returns:
+        list: The selected reference years.
+    """
+    if trailing:
+        return [x for x in sorted(available) if x < year and x not in exclude][-trailing:]
+
+    return [x for x in fixed if x not in exclude]
+
+
+def derive(paths, ids):
+    """Derives a historic baseline from the tables of the reference years.
+
+    Maxima are joined by id, so the years do not need to share the same
+    fields or field order. Fields missing from a year are ignored for that
+    year.
+
+    Args:
+        paths (list): Cache entry prefixes of the reference years.
+
+        ids (ndarray): Field ids the baseline is computed for.
+
+    Returns:
+        DataFrame: A pandas object indexed by ids with the highest smoothed
+                   value per season across the reference years.
+    """
+    ids = np.asarray(ids)
+    out = np.full((len(ids), len(features.SEASONS)), np.nan)
+
+    for x in paths:
+        id_, maxima = values(x)
+        if not len(id_):
+            continue
+
+        pos = np.searchsorted(id_, ids).clip(0, len(id_)-1)
+        found = id_[pos] == ids
+
+        # only the rows of the requested fields are read from the table
+        out[found] = np.fmax(out[found], maxima[pos[found]])
+
+    return pd.DataFrame(out, index=pd.Index(ids, name='id'), columns=list(features.SEASONS))
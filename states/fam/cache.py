@@ -0,0 +1,238 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : cache.py
+# description     : Binary cache of processed years. Each year is stored as a typed ndvi matrix and an id vector in
+#                   .npy format next to a small .json manifest holding the fingerprint of the input csvs. Entries
+#                   are loaded memory-mapped and are only rebuilt when their input files change.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# bump to invalidate every cache entry after a change to the processing routines
+CACHE_VERSION = 1
+
+# suffix of the memo of per-file digests keyed by size and modification time
+MEMO = '.files.json'
+
+
+def digest(path):
+    """Hashes the contents of a single file.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hexadecimal sha1 digest of the file contents.
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def fingerprint(files, memo=None):
+    """Computes a content based key for a set of input files.
+
+    Digests of unchanged files (same size and modification time) are reused
+    from the memo file so that warm starts do not re-read every input csv.
+
+    Args:
+        files (list): A list of .csv files.
+
+        memo (str): Optional path to a .json file used to remember digests.
+
+    Returns:
+        str: Hexadecimal sha1 digest covering all files.
+    """
+    known = {}
+    if memo is not None and os.path.exists(memo):
+        with open(memo) as f:
+            known = json.load(f)
+
+    changed = False
+    h = hashlib.sha1(str(CACHE_VERSION).encode())
+    for x in sorted(files):
+        stat = os.stat(x)
+        entry = known.get(x)
+
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            entry = [stat.st_size, stat.st_mtime_ns, digest(x)]
+            known[x] = entry
+            changed = True
+
+        h.update(os.path.basename(x).encode())
+        h.update(entry[2].encode())
+
+    if memo is not None and changed:
+        write(memo, lambda f: json.dump(known, f), 'w')
+
+    return h.hexdigest()
+
+
+def write(path, writer, mode='wb'):
+    """Atomically writes a file.
+
+    Args:
+        path (str): Destination path.
+
+        writer (function): Called with an open temporary file to write to.
+
+        mode (str): Mode used to open the temporary file.
+    """
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, mode) as f:
+        writer(f)
+    os.replace(tmp, path)
+
+
+def store(path, key, df):
+    """Writes a processed year to the cache.
+
+    The manifest is removed first and written last so that an interrupted
+    write is never mistaken for a valid entry.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        key (str): Fingerprint of the input files.
+
+        df (DataFrame): A pandas object which contains formatted ndvi time
+                        series data indexed by id.
+    """
+    if os.path.exists(path + '.json'):
+        os.remove(path + '.json')
+
+    write(path + '.id.npy', lambda f: np.save(f, np.asarray(df.index.values)))
+    write(path + '.ndvi.npy', lambda f: np.save(f, np.ascontiguousarray(df.values)))
+
+    manifest = {'key': key, 'version': CACHE_VERSION, 'dates': [str(x) for x in df.columns],
+        'shape': list(df.shape), 'dtype': str(df.values.dtype)}
+    write(path + '.json', lambda f: json.dump(manifest, f), 'w')
+
+
+def key(path):
+    """Reads the fingerprint of a cache entry.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+    Returns:
+        str: Fingerprint of the input files, or None if there is no entry.
+    """
+    try:
+        with open(path + '.json') as f:
+            return json.load(f)['key']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def rekey(path, key):
+    """Replaces the fingerprint of a cache entry updated in place.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        key (str): Fingerprint of the new set of input files.
+    """
+    with open(path + '.json') as f:
+        manifest = json.load(f)
+
+    manifest['key'] = key
+    write(path + '.json', lambda f: json.dump(manifest, f), 'w')
+
+
+def load(path, key=None):
+    """Reads a processed year from the cache.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        key (str): Expected fingerprint of the input files. If omitted any
+                   complete entry is accepted.
+
+    Returns:
+        DataFrame: A pandas object backed by a memory-mapped ndvi matrix, or
+                   None if the entry is missing or stale.
+    """
+    try:
+        with open(path + '.json') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('version') != CACHE_VERSION or (key is not None and manifest['key'] != key):
+        return None
+
+    ids = np.load(path + '.id.npy')
+    ndvi = np.load(path + '.ndvi.npy', mmap_mode='c')
+
+    if list(ndvi.shape) != manifest['shape'] or len(ids) != ndvi.shape[0]:
+        return None
+
+    return pd.DataFrame(ndvi, index=pd.Index(ids, name='id'), columns=manifest['dates'], copy=False)
+
+
+def rows(path, ids):
+    """Reads a few fields of a processed year from the cache.
+
+    Only the rows of the requested fields are read from the memory-mapped
+    matrix.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        ids (ndarray): Field ids to read.
+
+    Returns:
+        DataFrame: A pandas object indexed by the sorted ids found in the
+                   entry, or None if the entry is missing.
+    """
+    try:
+        with open(path + '.json') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    known = np.load(path + '.id.npy', mmap_mode='r')
+    ndvi = np.load(path + '.ndvi.npy', mmap_mode='r')
+
+    ids = np.unique(np.asarray(ids, dtype=known.dtype))
+    pos = np.searchsorted(known, ids).clip(0, max(len(known)-1, 0))
+    found = known[pos] == ids if len(known) else np.zeros(len(ids), dtype=bool)
+
+    return pd.DataFrame(ndvi[pos[found]], index=pd.Index(ids[found], name='id'), columns=manifest['dates'])
+
+
+def fetch(path, files, year, process):
+    """Loads a year from the cache, rebuilding it only if its inputs changed.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        files (list): A list of .csv files for the year.
+
+        year (int): Corresponding year to input data.
+
+        process (function): Called as process(files, year) on a cache miss.
+
+    Returns:
+        DataFrame: A pandas object with properly formatted times series data.
+    """
+    key = fingerprint(files, path + MEMO)
+
+    df = load(path, key)
+    if df is None:
+        print("Cache miss: processing", year)
+        df = process(files, year)
+        store(path, key, df)
+
+    return df
@@ -0,0 +1,140 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : cli.py
+# description     : Command line options shared by the state level F.A.M. scripts.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import argparse
+import importlib.util
+
+
+def parse(state, argv=None):
+    """Parses the command line options of a state script.
+
+    Args:
+        state (str): Name of the state, used in the help text.
+
+        argv (list): Optional arguments, defaults to sys.argv.
+
+    Returns:
+        Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Fallowed Area Mapping for the state of " + state + ".")
+
+    parser.add_argument('--workers', type=int, default=1,
+        help="number of processes used to process and classify years (default: 1)")
+
+    parser.add_argument('--threads', type=int, default=4,
+        help="number of raw .csv files each process parses at once (default: 4)")
+
+    years = lambda x: [int(y) for y in x.split(',') if y]
+
+    parser.add_argument('--baseline-years', type=years, default=None,
+        help="comma separated historic reference years (default: the years set in the script)")
+
+    parser.add_argument('--baseline-trailing', type=int, default=0,
+        help="use this many years before each classified year as reference instead of fixed years")
+
+    parser.add_argument('--baseline-exclude', type=years, default=[],
+        help="comma separated years never used as reference, e.g. drought years")
+
+    parser.add_argument('--align', choices=['intersection', 'union'], default='intersection',
+        help="limit every year to the fields found in all of the common years, or in any of them (California only, default: intersection)")
+
+    parser.add_argument('--year', type=years, default=None,
+        help="classify and export only these comma separated years, skipping those unchanged since their last export")
+
+    parser.add_argument('--resume', action='store_true',
+        help="continue an interrupted run, skipping years already exported from the same inputs, baseline and script")
+
+    parser.add_argument('--append', type=lambda x: [y for y in x.split(',') if y], default=None,
+        help="comma separated newly arrived input files of the --year years, folded into the cached years in place")
+
+    parser.add_argument('--sweep', default=None,
+        help=".csv file of threshold combinations to evaluate instead of classifying, one column per threshold")
+
+    parser.add_argument('--sweep-area', default=None,
+        help=".csv file of field ids and areas used to report the acreage of each class in a sweep")
+
+    parser.add_argument('--compact', action='store_true',
+        help="read, cache and classify float32 ndvi with int32 ids and export int16 statuses to halve memory use")
+
+    parser.add_argument('--compact-report', action='store_true',
+        help="with --compact, also classify through the float64 path and export the differences of each year")
+
+    parser.add_argument('--output', choices=['csv', 'npz', 'parquet'], default='csv',
+        help="format of the exports, .npz and .parquet files are partitioned by state, year and season (default: csv)")
+
+    parser.add_argument('--output-mode', choices=['slim', 'full'], default=None,
+        help="export only ids, statuses and percent of the historic average, or every column (default: full for csv)")
+
+    parser.add_argument('--cube', action='store_true',
+        help="also fold the loaded years into cache/cube, a memory-mapped years x fields x 46 array indexed by id")
+
+    parser.add_argument('--delta', action='store_true',
+        help="also write the rows whose status changed since the previous export of each year, and a change log, to output/delta")
+
+    parser.add_argument('--history', action='store_true',
+        help="also export the fallow years, longest fallow run and first and last fallow year of every field to output/<State>_History")
+
+    parser.add_argument('--districts', action='store_true',
+        help="also count the field statuses of every exported season per legislative district to output/<State>_Districts.csv")
+
+    parser.add_argument('--pipeline', action='store_true',
+        help="read, classify and export consecutive years at once on separate threads, holding only a few years in memory")
+
+    parser.add_argument('--shard-size', type=int, default=0,
+        help="run fields in shards of about this many ids to bound memory, 0 disables sharding (default: 0)")
+
+    parser.add_argument('--profile', type=lambda x: [y for y in x.split(',') if y], default=[],
+        help="comma separated stages to run under cProfile, e.g. ingest,fallowMapping, written next to the run report")
+
+    args = parser.parse_args(argv)
+    if args.append and not args.year:
+        parser.error("--append requires --year")
+    if args.append and args.shard_size:
+        parser.error("--append cannot be combined with --shard-size")
+    if args.sweep and args.shard_size:
+        parser.error("--sweep cannot be combined with --shard-size")
+    if args.pipeline and args.sweep:
+        parser.error("--pipeline cannot be combined with --sweep")
+    if args.compact_report and not args.compact:
+        parser.error("--compact-report requires --compact")
+    if args.compact_report and args.shard_size:
+        parser.error("--compact-report cannot be combined with --shard-size")
+    if args.delta and args.shard_size:
+        parser.error("--delta cannot be combined with --shard-size")
+    if args.history and args.shard_size:
+        parser.error("--history cannot be combined with --shard-size")
+    if args.districts and args.shard_size:
+        parser.error("--districts cannot be combined with --shard-size")
+    if args.output == 'parquet' and not any(importlib.util.find_spec(x) for x in ['pyarrow', 'fastparquet']):
+        parser.error("--output parquet requires pyarrow or fastparquet")
+
+    if args.output_mode is None:
+        args.output_mode = 'full' if args.output == 'csv' else 'slim'
+
+    return args
+
+
+def strip(argv, option):
+    """Removes an option and its value from a list of arguments.
+
+    Args:
+        argv (list): Command line arguments.
+
+        option (str): Option to remove, e.g. "--shard-size".
+
+    Returns:
+        list: The remaining arguments.
+    """
+    out, skip = [], False
+    for x in argv:
+        if skip or x == option or x.startswith(option + '='):
+            skip = x == option
+            continue
+        out.append(x)
+
+    return out
@@ -0,0 +1,119 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : columnar.py
+# description     : Output formats of classified seasons. Besides the legacy .csv exports, seasons can be written as
+#                   columnar .npz bundles or .parquet files partitioned by state, year and season, either slim (id,
+#                   field status and percent of the historic average) or full, so that readers can load single
+#                   columns without parsing the whole file.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from fam import cache
+
+# supported output formats, .parquet needs pyarrow or fastparquet
+FORMATS = ['csv', 'npz', 'parquet']
+
+# columns of a slim export next to the id
+SLIM = ['field_status', 'percent_5yr_Avg']
+
+
+def partition(state, year, season, root='output'):
+    """Names the columnar export of a season.
+
+    Args:
+        state (str): Name of the state.
+
+        year (int): Classified year.
+
+        season (str): Name of the season, e.g. "spring".
+
+        root (str): Folder holding the partitions.
+
+    Returns:
+        str: Export path without its extension, e.g.
+             "output/state=Nevada/year=2019/season=season/part".
+    """
+    return os.path.join(root, 'state='+state, 'year='+str(year), 'season='+season, 'part')
+
+
+def write(df, name, fmt='csv', full=True):
+    """Writes a classified season.
+
+    Args:
+        df (DataFrame): A pandas object with classified times series data
+                        indexed by id.
+
+        name (str): Export path without its extension.
+
+        fmt (str): One of FORMATS.
+
+        full (bool): Keep every column, otherwise only the SLIM columns.
+    """
+    if not full:
+        df = df[[x for x in df.columns if x in SLIM]]
+
+    os.makedirs(os.path.dirname(name) or '.', exist_ok=True)
+
+    if fmt == 'csv':
+        cache.write(name + '.csv', lambda f: df.to_csv(f, header=True), 'w')
+    elif fmt == 'npz':
+        # text columns as fixed width strings, object arrays would need pickling
+        data = {str(x): df[x].to_numpy() if pd.api.types.is_numeric_dtype(df[x]) else df[x].to_numpy(dtype=str)
+            for x in df.columns}
+        cache.write(name + '.npz', lambda f: np.savez(f, id=df.index.values,
+            columns=np.array([str(x) for x in df.columns], dtype=str), **data))
+    else:
+        cache.write(name + '.parquet', lambda f: df.rename(columns=str).to_parquet(f, index=True))
+
+
+def read(name, fmt='csv', columns=None):
+    """Reads a classified season, loading only the requested columns.
+
+    Args:
+        name (str): Export path without its extension.
+
+        fmt (str): One of FORMATS.
+
+        columns (list): Columns to read, defaults to every column.
+
+    Returns:
+        DataFrame: A pandas object indexed by id.
+    """
+    if fmt == 'csv':
+        usecols = None if columns is None else lambda x: x in ['id'] + list(columns)
+        return pd.read_csv(name + '.csv', index_col='id', usecols=usecols, float_precision='round_trip')
+
+    if fmt == 'npz':
+        with np.load(name + '.npz') as f:
+            columns = [str(x) for x in f['columns']] if columns is None else list(columns)
+            return pd.DataFrame({x: f[x] for x in columns}, index=pd.Index(f['id'], name='id'))
+
+    return pd.read_parquet(name + '.parquet', columns=columns)
+
+
+def merge(df, name, fmt='csv'):
+    """Overwrites the rows of an existing export.
+
+    Only the columns present in the export are updated, so slim exports
+    stay slim.
+
+    Args:
+        df (DataFrame): Classified rows indexed by id, all present in the
+                        export.
+
+        name (str): Export path without its extension.
+
+        fmt (str): One of FORMATS.
+    """
+    out = read(name, fmt)
+    for x in df.columns:
+        if str(x) in out.columns:
+            out.loc[df.index, str(x)] = df[x].values
+
+    write(out, name, fmt)
@@ -0,0 +1,63 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : compact.py
+# description     : Compact representation mode. Observations are read as float32 ndvi, int32 ids and int16 date
+#                   codes, processed years are cached and classified in float32, and exports carry int16 statuses
+#                   and float32 values. A report compares the compact classification with the float64 path.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import numpy as np
+import pandas as pd
+
+# compact dtypes of ndvi values, field ids, date codes and field statuses (the -9999 sentinel rules out int8)
+NDVI = np.float32
+IDS = np.int32
+CODES = np.int16
+STATUS = np.int16
+
+
+def shrink(df):
+    """Casts a classified season to the compact dtypes.
+
+    Args:
+        df (DataFrame): A pandas object with classified times series data.
+
+    Returns:
+        DataFrame: The same data with int16 statuses and float32 values.
+    """
+    return df.astype({x: STATUS if x == 'field_status' else NDVI for x in df.columns})
+
+
+def report(ref, new, name):
+    """Summarizes the differences between float64 and compact results.
+
+    Args:
+        ref (list): Classified seasons of the float64 path.
+
+        new (list): The same seasons classified in compact mode.
+
+        name (list): Name of each season.
+
+    Returns:
+        DataFrame: One row per season with the number of fields compared,
+                   the share and number of fields with the same status,
+                   the largest difference in percent of the historic average
+                   and the largest and mean absolute ndvi difference.
+    """
+    rows = []
+    for a, b, season in zip(ref, new, name):
+        ids = a.index.intersection(b.index)
+        a, b = a.loc[ids], b.loc[ids]
+
+        same = a['field_status'].values == b['field_status'].values
+        pnorm = np.abs(a['percent_5yr_Avg'].values - b['percent_5yr_Avg'].values.astype(np.float64))
+        ndvi = np.abs(a.iloc[:, 2:].values - b.iloc[:, 2:].values.astype(np.float64))
+
+        rows.append({'season': season, 'fields': len(ids), 'status_agreement': same.mean() if len(ids) else 1.0,
+            'status_changed': int((~same).sum()), 'percent_max_abs_diff': np.nanmax(pnorm, initial=0),
+            'ndvi_max_abs_diff': np.nanmax(ndvi, initial=0),
+            'ndvi_mean_abs_diff': np.nanmean(ndvi) if ndvi.size else 0.0})
+
+    return pd.DataFrame(rows).set_index('season')
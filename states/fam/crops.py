@@ -0,0 +1,139 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : crops.py
+# description     : Compiled perennial crop data. The crop table is parsed once into sorted ids and compact crop group
+#                   codes, cached as a binary file keyed by the contents of the table, and the perennial mask of any
+#                   set of fields is gathered by id rather than by position. A year may come with its own version of
+#                   the crop table, compiled and cached separately.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import functools
+
+import numpy as np
+import pandas as pd
+
+from fam import cache
+
+# crop table shared by every year, e.g. input/crop_data/perennial.csv
+TABLE = 'perennial'
+
+
+def source(folder, year=None):
+    """Finds the crop table of a year.
+
+    Args:
+        folder (str): Folder of the crop data, e.g. "input/crop_data".
+
+        year (int): Classified year, a perennial_<year>.csv table takes
+                    precedence over the shared one.
+
+    Returns:
+        str: Path to the .csv crop table.
+    """
+    path = os.path.join(folder, TABLE + '_' + str(year) + '.csv')
+
+    return path if year is not None and os.path.exists(path) else os.path.join(folder, TABLE + '.csv')
+
+
+def parse(path):
+    """Parses a crop table.
+
+    Args:
+        path (str): Path to the .csv crop table, with id and crop_group
+                    columns.
+
+    Returns:
+        tuple: Sorted ids (ndarray), the crop group code of each id (int16
+               ndarray, 0 for fields without a perennial crop group) and the
+               crop group names (ndarray), code k naming group k-1.
+    """
+    df = pd.read_csv(path, usecols=['id', 'crop_group'], dtype={'crop_group': 'category'})
+    df = df.drop_duplicates('id', keep='last').sort_values('id')
+
+    group = df['crop_group'].cat.remove_unused_categories()
+
+    return (df['id'].values.astype(np.int64), (group.cat.codes.values + 1).astype(np.int16),
+        np.asarray(group.cat.categories, dtype=str))
+
+
+@functools.lru_cache(maxsize=None)
+def load(path, prefix, key):
+    """Loads a compiled crop table, parsing it again when its contents change.
+
+    Args:
+        path (str): Path to the .csv crop table.
+
+        prefix (str): Cache prefix of the compiled tables, e.g. "cache/crops".
+
+        key (str): Fingerprint of the crop table.
+
+    Returns:
+        tuple: Output of parse().
+    """
+    name = prefix + '_' + os.path.splitext(os.path.basename(path))[0] + '.npz'
+
+    try:
+        with np.load(name) as f:
+            if str(f['key']) == key:
+                return f['id'], f['group'], f['names']
+    except (OSError, KeyError, ValueError):
+        pass
+
+    ids, group, names = parse(path)
+    cache.write(name, lambda f: np.savez(f, key=key, id=ids, group=group, names=names))
+
+    return ids, group, names
+
+
+def table(path, prefix='cache/crops'):
+    """Reads a crop table through its compiled cache.
+
+    Args:
+        path (str): Path to the .csv crop table, see source().
+
+        prefix (str): Cache prefix of the compiled tables.
+
+    Returns:
+        tuple: Output of parse().
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    return load(path, prefix, cache.fingerprint([path], prefix + '_' + name + cache.MEMO))
+
+
+def groups(crops, ids):
+    """Gathers the crop group codes of a set of fields.
+
+    Args:
+        crops (tuple): Output of table().
+
+        ids (ndarray): Field ids in any order.
+
+    Returns:
+        ndarray: Crop group code of each field, 0 for fields missing from
+                 the crop table or without a perennial crop group.
+    """
+    known, group, names = crops
+    if not len(known):
+        return np.zeros(len(ids), dtype=np.int16)
+
+    pos = np.searchsorted(known, ids).clip(0, len(known)-1)
+
+    return np.where(known[pos] == ids, group[pos], 0).astype(np.int16)
+
+
+def mask(crops, ids):
+    """Gathers the perennial crop mask of a set of fields.
+
+    Args:
+        crops (tuple): Output of table().
+
+        ids (ndarray): Field ids in any order.
+
+    Returns:
+        ndarray: True for fields with a perennial crop group.
+    """
+    return groups(crops, ids) > 0
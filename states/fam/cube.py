@@ -0,0 +1,210 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : cube.py
+# description     : Memory-mapped years x fields x 46 ndvi cube. Cached years are folded into a single raw array on
+#                   disk one at a time, with the sorted ids of every field seen in any year as its row index, so
+#                   that the full history of a few fields is read without loading whole years and reductions over
+#                   years (baselines, frequencies) run as array operations on a single block.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from fam import cache, features
+
+# interval dates per year
+DATES = 46
+
+
+def manifest(path):
+    """Reads the manifest of a cube.
+
+    Args:
+        path (str): Cube prefix, e.g. "cache/cube".
+
+    Returns:
+        dict: The years, their cache keys, the dtype and the number of
+              fields, or None if the cube is missing, stale or incomplete.
+    """
+    try:
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        ids = np.load(path + '.id.npy', mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+    size = len(meta['years']) * meta['fields'] * DATES * np.dtype(meta['dtype']).itemsize
+    if meta.get('version') != cache.CACHE_VERSION or len(ids) != meta['fields'] or os.path.getsize(path + '.ndvi') < size:
+        return None
+
+    return meta
+
+
+def view(path):
+    """Maps a cube into memory.
+
+    Args:
+        path (str): Cube prefix, e.g. "cache/cube".
+
+    Returns:
+        tuple: Years of the cube (list), sorted field ids (ndarray) and the
+               read-only years x fields x 46 ndvi array (memmap), or None if
+               there is no valid cube.
+    """
+    meta = manifest(path)
+    if meta is None or not meta['years']:
+        return None
+
+    shape = (len(meta['years']), meta['fields'], DATES)
+
+    return meta['years'], np.load(path + '.id.npy'), np.memmap(path + '.ndvi', meta['dtype'], 'r', shape=shape)
+
+
+def grow(path, meta, ids):
+    """Rewrites a cube onto a larger set of fields, one year at a time.
+
+    Args:
+        path (str): Cube prefix, e.g. "cache/cube".
+
+        meta (dict): Output of manifest().
+
+        ids (ndarray): Sorted field ids, a superset of those of the cube.
+    """
+    years, old, ndvi = view(path)
+    rows = np.searchsorted(ids, old)
+
+    def copy(f):
+        for k in range(len(years)):
+            slab = np.full((len(ids), DATES), np.nan, dtype=ndvi.dtype)
+            slab[rows] = ndvi[k]
+            f.write(slab.tobytes())
+
+    cache.write(path + '.ndvi', copy)
+    cache.write(path + '.id.npy', lambda f: np.save(f, ids))
+
+    meta['fields'] = len(ids)
+    cache.write(path + '.json', lambda f: json.dump(meta, f), 'w')
+
+
+def add(path, entry, year):
+    """Folds a cached year into a cube, skipping it if it did not change.
+
+    Years are appended to the end of the file or overwritten in place.
+    Fields not seen before grow the cube, which rewrites it once.
+
+    Args:
+        path (str): Cube prefix, e.g. "cache/cube".
+
+        entry (str): Cache entry prefix of the year, e.g. "cache/yr_2019".
+
+        year (int): Corresponding year of the entry.
+
+    Returns:
+        bool: True if the cube was updated.
+    """
+    key = cache.key(entry)
+    meta = manifest(path)
+    if meta is not None and year in meta['years'] and meta['keys'][meta['years'].index(year)] == key:
+        return False
+
+    df = cache.load(entry)
+    ids, values = df.index.values, df.values
+
+    if meta is None or meta['dtype'] != str(values.dtype):
+        meta = {'version': cache.CACHE_VERSION, 'dtype': str(values.dtype), 'fields': len(ids), 'years': [], 'keys': []}
+        cache.write(path + '.ndvi', lambda f: None)
+        cache.write(path + '.id.npy', lambda f: np.save(f, ids))
+    elif not np.isin(ids, np.load(path + '.id.npy'), assume_unique=True).all():
+        grow(path, meta, np.union1d(np.load(path + '.id.npy'), ids))
+
+    known = np.load(path + '.id.npy')
+    slab = np.full((len(known), DATES), np.nan, dtype=values.dtype)
+    slab[np.searchsorted(known, ids)] = values
+
+    if year in meta['years']:
+        # invalidate the year until its slab is written
+        k = meta['years'].index(year)
+        meta['keys'][k] = None
+        cache.write(path + '.json', lambda f: json.dump(meta, f), 'w')
+
+        ndvi = np.memmap(path + '.ndvi', slab.dtype, 'r+', shape=(len(meta['years']), len(known), DATES))
+        ndvi[k] = slab
+        ndvi.flush()
+        del ndvi
+    else:
+        # drop the tail of an interrupted append
+        k = len(meta['years'])
+        with open(path + '.ndvi', 'r+b') as f:
+            f.truncate(k * slab.nbytes)
+            f.seek(0, os.SEEK_END)
+            f.write(slab.tobytes())
+        meta['years'].append(year)
+        meta['keys'].append(None)
+
+    meta['keys'][k] = key
+    cache.write(path + '.json', lambda f: json.dump(meta, f), 'w')
+
+    return True
+
+
+def history(path, ids=None, years=None):
+    """Reads the ndvi of a set of fields over a set of years.
+
+    Only the rows of the requested fields are read from disk.
+
+    Args:
+        path (str): Cube prefix, e.g. "cache/cube".
+
+        ids (ndarray): Field ids, defaults to every field of the cube.
+
+        years (list): Years to read, defaults to every year of the cube.
+
+    Returns:
+        ndarray: The years x ids x 46 ndvi array, missing for fields absent
+                 from a year or from the cube.
+    """
+    have, known, ndvi = view(path)
+    ids = known if ids is None else np.asarray(ids)
+    years = have if years is None else list(years)
+
+    rows = np.searchsorted(known, ids).clip(0, len(known)-1)
+    found = known[rows] == ids
+    slabs = [have.index(x) for x in years]
+
+    out = np.full((len(years), len(ids), DATES), np.nan, dtype=ndvi.dtype)
+    out[:, found] = ndvi[np.ix_(slabs, rows[found])]
+
+    return out
+
+
+def maxima(path, years, ids=None):
+    """Computes a historic baseline over the years of a cube.
+
+    Matches baseline.derive() over the same years, from a single block of
+    the cube instead of the per year tables.
+
+    Args:
+        path (str): Cube prefix, e.g. "cache/cube".
+
+        years (list): Reference years.
+
+        ids (ndarray): Field ids, defaults to every field of the cube.
+
+    Returns:
+        DataFrame: A pandas object indexed by id with the highest smoothed
+                   value per season across the years.
+    """
+    ids = view(path)[1] if ids is None else np.asarray(ids)
+    if not years:
+        return pd.DataFrame(np.nan, index=pd.Index(ids, name='id'), columns=list(features.SEASONS))
+
+    ndvi = history(path, ids, years)
+    feats = features.seasons(ndvi.reshape(-1, DATES))
+
+    return pd.DataFrame({x: np.fmax.reduce(feats[x]['ndvi_smoothed_max1'].reshape(len(years), -1), axis=0)
+        for x in features.SEASONS}, index=pd.Index(ids, name='id'))
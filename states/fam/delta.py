@@ -0,0 +1,71 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : delta.py
+# description     : Delta exports between runs. The statuses of a classified year are compared with the status vector
+#                   kept by the previous export of that year, and only the rows of fields whose status changed are
+#                   written, next to a compact change log of old and new codes, so downstream consumers sync small
+#                   diffs instead of re-ingesting every season in full. The deltas of a year are cleared before it is
+#                   classified again, years skipped as up to date keep the deltas of the run that exported them.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from fam import columnar, history
+
+
+def clear(names):
+    """Removes the delta exports of years about to be classified again.
+
+    Args:
+        names (list): Delta export and change log paths without their
+                      extension, removed in every columnar format.
+    """
+    for name in names:
+        for fmt in columnar.FORMATS:
+            if os.path.exists(name + '.' + fmt):
+                os.remove(name + '.' + fmt)
+
+
+def diff(old, fam, seasons, partial=False):
+    """Finds the fields whose status changed since the previous export.
+
+    Args:
+        old (DataFrame): Output of history.vector() for the previous export
+                         of the year, None if the year was never kept.
+
+        fam (list): Classified seasons, pandas objects indexed by id with a
+                    field_status column.
+
+        seasons (list): Name of each season.
+
+        partial (bool): fam only holds some fields, e.g. after a streamed
+                        update, so fields missing from it did not change.
+
+    Returns:
+        tuple: The changed rows of each season (list of DataFrames) and the
+               change log, a pandas object indexed by id with the season and
+               the old and new status of every change, MISSING for fields
+               that appeared or disappeared.
+    """
+    new = history.codes(fam, seasons)
+
+    rows, log = [], []
+    for df, season in zip(fam, seasons):
+        before = old[season] if old is not None and season in old else pd.Series([], dtype=np.int8)
+        after = new[season].loc[df.index]
+
+        ids = after.index if partial else after.index.union(before.index)
+        a = before.reindex(ids, fill_value=history.MISSING).values
+        b = after.reindex(ids, fill_value=history.MISSING).values
+        changed = a != b
+
+        rows.append(df[df.index.isin(ids[changed])])
+        log.append(pd.DataFrame({'season': season, 'old': a[changed], 'new': b[changed]},
+            index=pd.Index(ids[changed], name='id')))
+
+    return rows, pd.concat(log)
@@ -0,0 +1,276 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : districts.py
+# description     : District level summaries of classified seasons. Field centroids are assigned to the polygons of
+#                   a district shapefile once, through a uniform grid index and a vectorized point in polygon test,
+#                   and the assignment is cached. Each classified season is then reduced to class counts and the
+#                   fallow share per district with a single bincount, without rendering maps.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import struct
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from fam import cache
+
+# cdl code of fallow fields in the exports
+FALLOW = 10
+
+# edge x point comparisons evaluated at once by the point in polygon test
+BLOCK = 2**21
+
+
+def polygons(path):
+    """Reads the polygons of a .shp file.
+
+    Args:
+        path (str): Path to the .shp file, holding polygon shapes.
+
+    Returns:
+        list: One entry per shape, the bounding box (tuple) and the rings
+              (list of n x 2 ndarrays) of each polygon, None for null shapes.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    shapes, pos = [], 100
+    while pos + 8 <= len(data):
+        length = struct.unpack('>i', data[pos+4:pos+8])[0] * 2
+        content, pos = data[pos+8:pos+8+length], pos + 8 + length
+
+        if struct.unpack('<i', content[:4])[0] == 0:
+            shapes.append(None)
+            continue
+
+        box = struct.unpack('<4d', content[4:36])
+        parts, points = struct.unpack('<2i', content[36:44])
+        starts = list(np.frombuffer(content, '<i4', parts, 44)) + [points]
+        xy = np.frombuffer(content, '<f8', points*2, 44 + 4*parts).reshape(-1, 2)
+
+        shapes.append((box, [xy[a:b] for a, b in zip(starts[:-1], starts[1:])]))
+
+    return shapes
+
+
+def records(path):
+    """Reads the attribute table of a .dbf file.
+
+    Args:
+        path (str): Path to the .dbf file.
+
+    Returns:
+        DataFrame: A pandas object with one row per shape, character fields
+                   as strings and numeric fields as numbers.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    n, start, size = struct.unpack('<IHH', data[4:12])
+
+    fields, pos = [], 32
+    while data[pos] != 0x0D:
+        fields.append((data[pos:pos+11].split(b'\0')[0].decode(), chr(data[pos+11]), data[pos+16]))
+        pos += 32
+
+    rows = []
+    for k in range(n):
+        record, offset, row = data[start + k*size:start + (k+1)*size], 1, {}
+        for name, kind, width in fields:
+            row[name] = record[offset:offset+width].decode('utf-8', 'replace').strip()
+            offset += width
+        rows.append(row)
+
+    df = pd.DataFrame(rows, columns=[x[0] for x in fields])
+    for name, kind, width in fields:
+        if kind in 'NF':
+            df[name] = pd.to_numeric(df[name], errors='coerce')
+
+    return df
+
+
+def edges(rings):
+    """Collects the edges of a polygon.
+
+    Args:
+        rings (list): Rings of the polygon, see polygons().
+
+    Returns:
+        ndarray: Edges as x1, y1, x2, y2 columns, without horizontal edges
+                 which never cross a horizontal ray.
+    """
+    out = np.concatenate([np.hstack([r[:-1], r[1:]]) for r in rings])
+
+    return out[out[:, 1] != out[:, 3]]
+
+
+def inside(x, y, edges):
+    """Tests points against a polygon with the even-odd rule.
+
+    Holes and multiple parts are handled by counting the crossings of every
+    ring together.
+
+    Args:
+        x (ndarray): Longitudes of the points.
+
+        y (ndarray): Latitudes of the points.
+
+        edges (ndarray): Output of edges(), or those of its edges spanning
+                         the latitudes of the points.
+
+    Returns:
+        ndarray: True for points inside the polygon.
+    """
+    x1, y1, x2, y2 = edges.T
+
+    out = np.zeros(len(x), dtype=bool)
+    step = max(1, BLOCK // max(len(x1), 1))
+    for lo in range(0, len(x), step):
+        px, py = x[lo:lo+step, None], y[lo:lo+step, None]
+        crosses = (y1 > py) != (y2 > py)
+        left = px < x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        out[lo:lo+step] = ((crosses & left).sum(axis=1) % 2).astype(bool)
+
+    return out
+
+
+def assign(x, y, shapes, cells=None):
+    """Assigns points to the polygons containing them.
+
+    Points are binned into a uniform grid. Each polygon is only tested against
+    the points in the grid cells its bounding box covers, one grid row at a
+    time against the edges spanning that row.
+
+    Args:
+        x (ndarray): Longitudes of the points.
+
+        y (ndarray): Latitudes of the points.
+
+        shapes (list): Output of polygons().
+
+        cells (int): Grid cells per side, defaults to about the square root
+                     of the number of points.
+
+    Returns:
+        ndarray: Position of the polygon holding each point in shapes, -1 for
+                 points outside every polygon.
+    """
+    out = np.full(len(x), -1, dtype=np.int32)
+    if not len(x):
+        return out
+
+    cells = cells or int(np.clip(np.sqrt(len(x)), 16, 1024))
+    x0, y0 = x.min(), y.min()
+    w = max(x.max() - x0, 1e-9) / cells
+    h = max(y.max() - y0, 1e-9) / cells
+
+    col = lambda v: int(np.clip((v - x0) // w, 0, cells-1))
+    row = lambda v: int(np.clip((v - y0) // h, 0, cells-1))
+
+    # points sorted by cell, cells of a grid row are contiguous
+    cell = np.clip(((y - y0) / h).astype(np.int64), 0, cells-1) * cells + np.clip(((x - x0) / w).astype(np.int64), 0, cells-1)
+    order = np.argsort(cell, kind='stable')
+    starts = np.searchsorted(cell[order], np.arange(cells*cells + 1))
+
+    for k, shape in enumerate(shapes):
+        if shape is None:
+            continue
+        (a, b, c, d), rings = shape
+        if c < x0 or a > x0 + w*cells or d < y0 or b > y0 + h*cells:
+            continue
+
+        e = edges(rings)
+        low, high = np.minimum(e[:, 1], e[:, 3]), np.maximum(e[:, 1], e[:, 3])
+
+        for r in range(row(b), row(d) + 1):
+            candidates = order[starts[r*cells + col(a)]:starts[r*cells + col(c) + 1]]
+            candidates = candidates[out[candidates] < 0]
+            if not len(candidates):
+                continue
+
+            py = y[candidates]
+            band = e[(high >= py.min()) & (low <= py.max())]
+            out[candidates[inside(x[candidates], py, band)]] = k
+
+    return out
+
+
+def index(path, shp, gps, column='NAME'):
+    """Loads the district of every field, assigning them only when the
+    shapefile or the centroids change.
+
+    Args:
+        path (str): Cache prefix of the assignment, e.g. "cache/districts".
+
+        shp (str): Path to the district .shp file, next to its .dbf file.
+
+        gps (str): Path to a .csv file of field ids and centroids (id, lon,
+                   lat).
+
+        column (str): Attribute naming the districts.
+
+    Returns:
+        tuple: Sorted field ids (ndarray), the district of each (ndarray, -1
+               outside every district) and the district names (ndarray).
+    """
+    key = hashlib.sha1((column + '=' + cache.digest(shp) + ':' + cache.digest(gps)).encode()).hexdigest()
+
+    try:
+        with np.load(path + '.npz') as f:
+            if str(f['key']) == key:
+                return f['id'], f['district'], f['names']
+    except (OSError, KeyError, ValueError):
+        pass
+
+    points = pd.read_csv(gps).sort_values('id')
+    names = records(os.path.splitext(shp)[0] + '.dbf')[column].astype(str).values
+
+    ids = points['id'].values
+    district = assign(points['lon'].values, points['lat'].values, polygons(shp))
+
+    cache.write(path + '.npz', lambda f: np.savez(f, key=key, id=ids, district=district, names=names))
+
+    return ids, district, names
+
+
+def summarize(statuses, assignment):
+    """Counts the field statuses of classified seasons per district.
+
+    Args:
+        statuses (dict): Field status (Series indexed by id) of each season,
+                         keyed by year and season name.
+
+        assignment (tuple): Output of index().
+
+    Returns:
+        DataFrame: A pandas object indexed by year, season and district
+                   holding the number of classified fields, the count of
+                   each status and the fallow share.
+    """
+    ids, district, names = assignment
+    codes = np.unique(np.concatenate([x.values for x in statuses.values()] + [[FALLOW]]))
+
+    frames = []
+    for (year, season), status in statuses.items():
+        pos = np.searchsorted(ids, status.index.values).clip(0, len(ids)-1)
+        where = np.where(ids[pos] == status.index.values, district[pos], -1)
+
+        inverse = np.searchsorted(codes, status.values[where >= 0])
+        counts = np.bincount(where[where >= 0] * len(codes) + inverse,
+            minlength=len(names)*len(codes)).reshape(len(names), len(codes))
+
+        df = pd.DataFrame(counts, columns=['status_' + str(x) for x in codes])
+        df.insert(0, 'fields', counts.sum(axis=1))
+        df.insert(0, 'district', names)
+        df.insert(0, 'season', season)
+        df.insert(0, 'year', year)
+        frames.append(df)
+
+    df = pd.concat(frames, ignore_index=True).set_index(['year', 'season', 'district'])
+    df['fallow_fraction'] = (df['status_' + str(FALLOW)] / df['fields'].where(df['fields'] > 0)).round(4)
+
+    return df
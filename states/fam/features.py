@@ -0,0 +1,95 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : features.py
+# description     : Single pass season feature kernel. The centered 5 observation rolling mean is derived from one
+#                   cumulative sum per year and every season's maxima are taken from it, replacing a pandas rolling
+#                   mean and two full sorts for each season. Windows of equal means are ranked on rounded values, so
+#                   the earliest date wins a tie, where pandas picks whichever the summation noise favours.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import numpy as np
+
+# season bounds as [start, end) column indices of the 46 date year (see DATE CONVERSION table)
+SEASONS = {'spring': (8, 19), 'overlap': (12, 23), 'summer': (19, 38), 'year': (0, 46)}
+
+# width of the centered smoothing window
+WINDOW = 5
+
+# decimals the smoothed values are compared at, windows of equal means differ by a few ulp after summing
+DECIMALS = 12
+
+
+def window(ndvi, csum, same, lo, hi):
+    """Centered rolling mean of a season from the cumulative sums of its year.
+
+    Windows are clipped to the season, matching a rolling mean with
+    min_periods=0 and center=True applied to the season slice alone. Windows
+    of identical values return that value exactly, as pandas does, so flat
+    stretches left by edge filling keep their first position as the maximum.
+
+    Args:
+        ndvi (ndarray): A 2-D float array of fields x dates.
+
+        csum (ndarray): Row wise cumulative sum with a leading column of zeros.
+
+        same (ndarray): Row wise cumulative count of neighbouring equal values
+                        with a leading column of zeros.
+
+        lo (int): First column of the season.
+
+        hi (int): Column after the last column of the season.
+
+    Returns:
+        ndarray: The smoothed fields x season values.
+    """
+    pos = np.arange(lo, hi)
+    a = np.maximum(pos - WINDOW//2, lo)
+    b = np.minimum(pos + WINDOW//2 + 1, hi)
+
+    flat = (same[:, b-1] - same[:, a]) == (b - a - 1)
+
+    return np.where(flat, ndvi[:, pos], (csum[:, b] - csum[:, a]) / (b - a))
+
+
+def seasons(ndvi, bounds=SEASONS):
+    """Computes the classification features of every season in one pass.
+
+    Args:
+        ndvi (ndarray): A 2-D float array of fields x 46 dates.
+
+        bounds (dict): Season name to [start, end) column indices.
+
+    Returns:
+        dict: Season name to a dict of arrays holding the highest raw value
+              (ndvi_max1), the 4th highest raw value (ndvi_max4), the highest
+              smoothed value (ndvi_smoothed_max1) and its column index
+              (ndvi_smoothed_argmax), the earliest of smoothed values equal
+              to DECIMALS decimals.
+    """
+    n, m = ndvi.shape
+
+    csum = np.zeros((n, m+1), dtype=np.float64)
+    np.cumsum(ndvi, axis=1, out=csum[:, 1:])
+
+    same = np.zeros((n, m), dtype=np.int32)
+    np.cumsum(ndvi[:, 1:] == ndvi[:, :-1], axis=1, out=same[:, 1:])
+
+    rows = np.arange(n)
+
+    feats = {}
+    for name, (lo, hi) in bounds.items():
+        raw = ndvi[:, lo:hi]
+        smoothed = window(ndvi, csum, same, lo, hi)
+
+        # tied windows are ranked on rounded means, so the earliest date wins whatever the summation order
+        top = np.round(smoothed, DECIMALS).argmax(axis=1)
+
+        feats[name] = {
+            'ndvi_max1': raw.max(axis=1),
+            'ndvi_max4': np.partition(raw, -4, axis=1)[:, -4],
+            'ndvi_smoothed_max1': smoothed[rows, top],
+            'ndvi_smoothed_argmax': lo + top}
+
+    return feats
@@ -0,0 +1,194 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : history.py
+# description     : Multi-year field status history. The statuses of every exported year are kept next to the cache
+#                   as a small int8 vector per season, assembled into a years x fields matrix and reduced with
+#                   cumulative operations to the number of fallow years, the longest consecutive fallow run and the
+#                   first and last fallow year of every field, without reading the exports back. A new vector is
+#                   staged until the export of its year is stamped.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import functools
+
+import numpy as np
+import pandas as pd
+
+from fam import cache
+
+# cdl code of fallow fields in the exports
+FALLOW = 10
+
+# status of a field missing from a year, or left unclassified by every rule
+MISSING = 0
+
+# suffix of a status vector written by an export that is not stamped yet
+STAGED = '.staged'
+
+
+def codes(fam, seasons):
+    """Collects the statuses of classified seasons as int8 codes.
+
+    Args:
+        fam (list): Classified seasons, pandas objects indexed by id with a
+                    field_status column.
+
+        seasons (list): Name of each season.
+
+    Returns:
+        DataFrame: An int8 pandas object indexed by id with one column per
+                   season, MISSING for statuses outside the int8 range.
+    """
+    df = pd.DataFrame({season: x['field_status'] for x, season in zip(fam, seasons)})
+    df = df.fillna(MISSING).where((df >= np.iinfo(np.int8).min) & (df <= np.iinfo(np.int8).max), MISSING)
+
+    return df.astype(np.int8)
+
+
+def store(path, fam, seasons, merge=False, staged=False):
+    """Keeps the statuses of a classified year.
+
+    A staged vector is only moved into place by settle(), once the export
+    of the year is stamped, so the vector a delta is compared with stays
+    that of the last complete export.
+
+    Args:
+        path (str): Status vector prefix, e.g. "cache/status_2019".
+
+        fam (list): Classified seasons, pandas objects indexed by id with a
+                    field_status column.
+
+        seasons (list): Name of each season.
+
+        merge (bool): Only overwrite the rows of fam, e.g. after a streamed
+                      update which classified the changed fields alone.
+
+        staged (bool): Write the vector next to the kept one, see settle().
+    """
+    df = codes(fam, seasons)
+
+    old = vector(path) if merge else None
+    if old is not None and list(old.columns) == list(df.columns):
+        df = pd.concat([old[~old.index.isin(df.index)], df])
+
+    cache.write(path + (STAGED if staged else '') + '.npz', lambda f: np.savez(f, id=df.index.values,
+        **{str(x): df[x].values for x in df.columns}))
+
+
+def settle(path, stamped):
+    """Moves a staged status vector into place, or drops it.
+
+    Args:
+        path (str): Status vector prefix, e.g. "cache/status_2019".
+
+        stamped (bool): The export that staged the vector was stamped, an
+                        interrupted one is classified again instead.
+    """
+    if not os.path.exists(path + STAGED + '.npz'):
+        return
+
+    if stamped:
+        os.replace(path + STAGED + '.npz', path + '.npz')
+    else:
+        os.remove(path + STAGED + '.npz')
+
+
+def vector(path):
+    """Loads the statuses kept for a classified year.
+
+    Args:
+        path (str): Status vector prefix, e.g. "cache/status_2019".
+
+    Returns:
+        DataFrame: An int8 pandas object indexed by id with one column per
+                   season, or None if the year was not kept.
+    """
+    if not os.path.exists(path + '.npz'):
+        return None
+
+    with np.load(path + '.npz') as f:
+        return pd.DataFrame({x: f[x] for x in f.files if x != 'id'}, index=pd.Index(f['id'], name='id'))
+
+
+def matrix(paths):
+    """Assembles the statuses of several years.
+
+    Args:
+        paths (list): Status vector prefix of each year, in year order.
+
+    Returns:
+        tuple: Sorted ids of every field seen in any year (ndarray) and the
+               years x fields int8 matrix of each season (dict), MISSING for
+               fields absent from a year or years not kept.
+    """
+    vectors = [vector(x) for x in paths]
+    kept = [x for x in vectors if x is not None]
+    if not kept:
+        return np.array([], dtype=np.int64), {}
+
+    ids = functools.reduce(np.union1d, [x.index.values for x in kept])
+
+    out = {}
+    for season in kept[0].columns:
+        out[season] = np.full((len(paths), len(ids)), MISSING, dtype=np.int8)
+        for k, df in enumerate(vectors):
+            if df is not None and season in df:
+                out[season][k, np.searchsorted(ids, df.index.values)] = df[season].values
+
+    return ids, out
+
+
+def statistics(years, status, code=FALLOW):
+    """Summarizes the years a status was given to each field.
+
+    A run counts consecutive rows of the matrix, i.e. consecutive input
+    years, and is broken by a year the field is missing from.
+
+    Args:
+        years (list): Year of each row of the matrix.
+
+        status (ndarray): Years x fields status matrix.
+
+        code (int): Status counted, fallow by default.
+
+    Returns:
+        dict: Number of years (int8), longest consecutive run (int8) and
+              first and last year (int16, 0 if never) of every field.
+    """
+    hit = status == code
+    years = np.asarray(years, dtype=np.int16)
+
+    # running count of hits, reset to zero after every miss
+    total = np.cumsum(hit, axis=0, dtype=np.int16)
+    run = total - np.maximum.accumulate(np.where(hit, 0, total), axis=0)
+
+    seen = hit.any(axis=0)
+    first = years[hit.argmax(axis=0)] if len(years) else np.zeros(status.shape[1], dtype=np.int16)
+    last = years[len(years)-1 - hit[::-1].argmax(axis=0)] if len(years) else first
+
+    return {'fallow_years': hit.sum(axis=0).astype(np.int8),
+        'longest_run': run.max(axis=0, initial=0).astype(np.int8),
+        'first_fallow': np.where(seen, first, 0).astype(np.int16),
+        'last_fallow': np.where(seen, last, 0).astype(np.int16)}
+
+
+def table(years, paths, code=FALLOW):
+    """Computes the fallow history of every field.
+
+    Args:
+        years (list): Input years, in order.
+
+        paths (list): Status vector prefix of each year.
+
+        code (int): Status counted, fallow by default.
+
+    Returns:
+        DataFrame: A pandas object indexed by id with the statistics() of
+                   every season, e.g. summer_fallow_years.
+    """
+    ids, status = matrix(paths)
+
+    return pd.DataFrame({season + '_' + name: values for season, x in status.items()
+        for name, values in statistics(years, x, code).items()}, index=pd.Index(ids, name='id'))
@@ -0,0 +1,104 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : incremental.py
+# description     : Bookkeeping for targeted runs. A classified year is stamped with a signature of everything its
+#                   exports depend on (its own cached inputs, those of its reference years, the script and any
+#                   auxiliary inputs), so a refresh only loads the years it needs and skips years that did not change.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import json
+import hashlib
+
+from fam import cache
+
+# prefix of the export stamps of classified years
+STAMP = 'cache/out_'
+
+
+def needed(targets, refs, common=()):
+    """Lists the years a targeted run has to load.
+
+    Args:
+        targets (list): Years to classify.
+
+        refs (function): Returns the historic reference years of a year.
+
+        common (list): Years every classified year depends on, e.g. the years
+                       shared field ids are taken from.
+
+    Returns:
+        list: Sorted years to load.
+    """
+    return sorted(set(targets).union(common, *[refs(x) for x in targets]))
+
+
+def signature(paths, files=()):
+    """Computes the signature of a classified year.
+
+    Args:
+        paths (list): Cache entry prefixes the year depends on.
+
+        files (list): Other files the exports depend on, e.g. the script
+                      holding the thresholds. Missing files are skipped.
+
+    Returns:
+        str: Hexadecimal sha1 digest.
+    """
+    h = hashlib.sha1(str(cache.CACHE_VERSION).encode())
+    for x in paths:
+        h.update((x + '=' + str(cache.key(x))).encode())
+
+    for x in files:
+        if os.path.exists(x):
+            h.update((os.path.basename(x) + '=' + cache.digest(x)).encode())
+
+    return h.hexdigest()
+
+
+def current(year, key, outputs):
+    """Checks whether the exports of a year are up to date.
+
+    Args:
+        year (int): Classified year.
+
+        key (str): Signature of the year as returned by signature().
+
+        outputs (list): Export files of the year.
+
+    Returns:
+        bool: True if the year was exported with the same signature and its
+              exports still exist.
+    """
+    return cache.key(STAMP + str(year)) == key and all(os.path.exists(x) for x in outputs)
+
+
+def mark(year, key):
+    """Stamps the exports of a year with its signature.
+
+    Args:
+        year (int): Classified year.
+
+        key (str): Signature of the year as returned by signature().
+    """
+    cache.write(STAMP + str(year) + '.json', lambda f: json.dump({'key': key}, f), 'w')
+
+
+def clean(folders):
+    """Removes the temporary files left by interrupted atomic writes.
+
+    Args:
+        folders (list): Folders searched recursively, e.g. ["cache", "output"].
+
+    Returns:
+        int: Number of files removed.
+    """
+    stale = [os.path.join(root, x) for folder in folders for root, dirs, files in os.walk(folder)
+        for x in files if x.endswith('.tmp')]
+
+    for x in stale:
+        os.remove(x)
+
+    return len(stale)
@@ -0,0 +1,291 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : ingest.py
+# description     : Sort-free ingest of the raw Earth Engine extractions. Observations are scattered straight into a
+#                   preallocated fields x dates matrix, keeping the maximum ndvi of duplicate observations, instead
+#                   of sorting, de-duplicating and pivoting the long format table. Files are parsed with explicit
+#                   dtypes and without building datetimes, on a pool of threads.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fam.compact import NDVI, IDS, CODES
+
+# files parsed at once, the csv tokenizer runs without the gil
+THREADS = 4
+
+
+def dates(year):
+    """Creates the 8 day interval dates of a year.
+
+    Args:
+        year (int): Corresponding year to input data.
+
+    Returns:
+        list: The 46 dates formatted as "YYYY-MM-DD" strings.
+    """
+    return pd.date_range("1-01-"+str(year), freq='8D', periods=46).strftime('%Y-%m-%d').tolist()
+
+
+def read(path, compact=False):
+    """Reads a single raw .csv file into compact arrays.
+
+    Dates are read as categories, so the long format table never holds one
+    python string or datetime per observation. Shards of fields spilled by
+    the shards module are read back from their .npz files.
+
+    Args:
+        path (str): Path to the .csv or .npz file.
+
+        compact (bool): Read float32 ndvi, int32 ids and int16 date codes
+                        instead of float64, int64 and int32.
+
+    Returns:
+        tuple: ndvi values (ndarray), ids (ndarray), date codes (ndarray) and
+               the unique date strings the codes refer to (ndarray).
+    """
+    ndvi, ids, codes = (NDVI, IDS, CODES) if compact else (np.float64, np.int64, np.int32)
+
+    if path.endswith('.npz'):
+        with np.load(path) as f:
+            return (f['ndvi'].astype(ndvi), f['id'].astype(ids), f['codes'].astype(codes),
+                f['uniques'].astype(object))
+
+    df = pd.read_csv(path, usecols=[1,2,3], header=0, names=['ndvi', 'id', 'date'],
+        dtype={'ndvi': ndvi, 'id': ids, 'date': 'category'}, engine='c')
+
+    date = df['date'].cat
+
+    return (df['ndvi'].to_numpy(), df['id'].to_numpy(), date.codes.to_numpy().astype(codes),
+        np.asarray(date.categories, dtype=object))
+
+
+def stream(paths, compact=False, threads=THREADS):
+    """Reads raw .csv files on a pool of threads, yielding them in order.
+
+    At most threads files are read ahead of the consumer, so work on a file
+    overlaps the parsing of the next ones without holding every file.
+
+    Args:
+        paths (list): Paths to the .csv or .npz files.
+
+        compact (bool): Read the compact dtypes, see read().
+
+        threads (int): Number of files parsed at once, 1 reads in the calling
+                       thread.
+
+    Yields:
+        tuple: Output of read() for each file.
+    """
+    paths = list(paths)
+    if threads <= 1 or len(paths) <= 1:
+        for x in paths:
+            yield read(x, compact)
+        return
+
+    with ThreadPoolExecutor(min(threads, len(paths))) as pool:
+        pending = collections.deque()
+        for x in paths:
+            pending.append(pool.submit(read, x, compact))
+            if len(pending) > threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def load(paths, compact=False, threads=THREADS):
+    """Reads raw .csv files on a pool of threads.
+
+    Args:
+        paths (list): Paths to the .csv or .npz files.
+
+        compact (bool): Read the compact dtypes, see read().
+
+        threads (int): Number of files parsed at once.
+
+    Returns:
+        list: Output of read() for each file.
+    """
+    return list(stream(paths, compact, threads))
+
+
+def summary(part):
+    """Summarizes the dates of a file for the column layout.
+
+    Args:
+        part (tuple): Output of read() for a single file.
+
+    Returns:
+        dict: Date string to the smallest and largest id observed on it.
+    """
+    values, id_, codes, uniques = part
+
+    lo = np.full(len(uniques), np.iinfo(np.int64).max)
+    hi = np.full(len(uniques), np.iinfo(np.int64).min)
+    np.minimum.at(lo, codes, id_)
+    np.maximum.at(hi, codes, id_)
+
+    return {str(d): (int(a), int(b)) for d, a, b in zip(uniques, lo, hi)}
+
+
+def layout(summaries, year):
+    """Determines the date columns of a year from per file summaries.
+
+    Reproduces the former sort, drop_duplicates and pivot sequence: columns
+    are the sorted union of observed and 8 day interval dates (the interval
+    dates are placeholder observations of id 1) and the first cell in id,
+    date order (the Earth Engine header row) is dropped along with its column
+    if nothing else was observed on that date.
+
+    Args:
+        summaries (list): Output of summary() for each input file.
+
+        year (int): Corresponding year to input data.
+
+    Returns:
+        tuple: Sorted date strings (ndarray) and the dropped (id, date) cell.
+    """
+    span = {d: (1, 1) for d in dates(year)}
+    for x in summaries:
+        for d, (a, b) in x.items():
+            lo, hi = span.get(d, (a, b))
+            span[d] = (min(lo, a), max(hi, b))
+
+    first = min(a for a, b in span.values())
+    drop = (first, min(d for d, (a, b) in span.items() if a == first))
+
+    cols = np.array(sorted(d for d, (a, b) in span.items() if d != drop[1] or b > first))
+
+    return cols, drop
+
+
+def accumulate(parts, ids, cols, out=None):
+    """Accumulates observations into a fields x dates matrix of maxima.
+
+    Each observation is mapped to a row by id and to a column by date and the
+    maximum ndvi of every cell is kept in a single pass. Cells without any
+    observation hold -inf, a cell with a missing ndvi among its duplicates
+    holds nan.
+
+    Args:
+        parts (list): Output of read() for each input file.
+
+        ids (ndarray): Sorted ids of the rows, covering every id in parts.
+
+        cols (ndarray): Sorted date strings of the columns.
+
+        out (ndarray): Optional contiguous matrix of maxima to accumulate
+                       into, e.g. the result of an earlier call.
+
+    Returns:
+        ndarray: The ids x dates matrix of maxima, in the dtype of the
+                 observations.
+    """
+    n, m = len(ids), len(cols)
+    dtype = np.result_type(*[x[0] for x in parts]) if parts else np.float64
+    ndvi = np.full(n*m, -np.inf, dtype=dtype) if out is None else out.reshape(-1)
+
+    for values, id_, codes, uniques in parts:
+        uniques = uniques.astype(str)
+        col = np.searchsorted(cols, uniques).clip(0, m-1)
+        found = (cols[col] == uniques)[codes]
+
+        # dates outside the layout only belong to the dropped cell
+        cell = np.searchsorted(ids, id_[found])*m + col[codes[found]]
+
+        # keep max duplicate, nan propagates like the sorted keep='last'
+        with np.errstate(invalid='ignore'):
+            np.maximum.at(ndvi, cell, values[found])
+
+    return ndvi.reshape(n, m)
+
+
+def finish(ndvi, ids, cols, year, drop):
+    """Turns a matrix of maxima into the ndvi matrix, in place.
+
+    Cells without observations become missing, as do the 8 day interval cells
+    of id 1, and the dropped cell is cleared.
+
+    Args:
+        ndvi (ndarray): Output of accumulate(), or a block of its rows.
+
+        ids (ndarray): Sorted ids of the rows of ndvi.
+
+        cols (ndarray): Sorted date strings of the columns.
+
+        year (int): Corresponding year to input data.
+
+        drop (tuple): The (id, date) cell to clear.
+
+    Returns:
+        ndarray: The ids x dates ndvi matrix.
+    """
+    ndvi[ndvi == -np.inf] = np.nan
+
+    # placeholder observations on 8 day interval for id 1
+    if 1 in ids:
+        ndvi[np.searchsorted(ids, 1), np.searchsorted(cols, dates(year))] = np.nan
+
+    # the first observation in id, date order
+    if drop[0] in ids and drop[1] in cols:
+        ndvi[np.searchsorted(ids, drop[0]), np.searchsorted(cols, drop[1])] = np.nan
+
+    return ndvi
+
+
+def scatter(parts, year, cols, drop):
+    """Scatters observations into a dense fields x dates matrix.
+
+    Args:
+        parts (list): Output of read() for each input file.
+
+        year (int): Corresponding year to input data.
+
+        cols (ndarray): Sorted date strings of the columns.
+
+        drop (tuple): The (id, date) cell to clear.
+
+    Returns:
+        tuple: Sorted ids (ndarray), sorted date strings (ndarray) and the
+               ids x dates ndvi matrix (ndarray).
+    """
+    ids = np.unique(np.concatenate([np.unique(x[1]) for x in parts])) if parts else np.array([], dtype=np.int64)
+
+    return ids, cols, finish(accumulate(parts, ids, cols), ids, cols, year, drop)
+
+
+def grid(parts, year, columns=None):
+    """Scatters observations into a dense fields x dates matrix.
+
+    Parts may be streamed, files are then summarized while the next ones are
+    being read.
+
+    Args:
+        parts (list): Output of read() for each input file, or stream().
+
+        year (int): Corresponding year to input data.
+
+        columns (tuple): Optional output of layout() computed over a larger
+                         set of files, e.g. the whole state when parts holds
+                         a single shard of fields.
+
+    Returns:
+        tuple: Sorted ids (ndarray), sorted date strings (ndarray) and the
+               ids x dates ndvi matrix (ndarray).
+    """
+    kept, summaries = [], []
+    for x in parts:
+        kept.append(x)
+        if columns is None:
+            summaries.append(summary(x))
+
+    if columns is None:
+        columns = layout(summaries, year)
+
+    return scatter(kept, year, *columns)
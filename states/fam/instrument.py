@@ -0,0 +1,199 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : instrument.py
+# description     : Per stage instrumentation of a state script run. Stages record wall time, cpu time (including
+#                   finished worker processes), the peak resident memory reached during the stage and row counts by
+#                   year and season. Records are appended to a .jsonl file as they complete, so forked workers report
+#                   as well, and are summarized into a .json and .csv run report at exit. Selected stages can be run
+#                   under cProfile.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import resource
+import threading
+import contextlib
+
+import pandas as pd
+
+from fam import cache
+
+# path prefix of the report and profiles and the stages to profile, set by begin()
+prefix = None
+profiled = set()
+
+# start of the run and the stages currently open in each thread
+start = time.time()
+local = threading.local()
+
+# memory peaks of the stages open in any thread, kept up to date whenever a stage resets the process peak
+opened = []
+lock = threading.Lock()
+
+
+def usage():
+    """Reads the cpu time and peak resident memory used so far.
+
+    Returns:
+        tuple: Cpu seconds of this process and its finished children (float)
+               and the larger peak resident memory of either in MB (float).
+    """
+    t = os.times()
+    peak = max(resource.getrusage(x).ru_maxrss for x in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN])
+
+    return t.user + t.system + t.children_user + t.children_system, peak / 2**10
+
+
+def memory(reset=False):
+    """Reads the peak resident memory of this process since the last reset.
+
+    Args:
+        reset (bool): Reset the peak to the current resident memory after
+                      reading it.
+
+    Returns:
+        float: Peak resident memory in MB, None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            peak = next(int(x.split()[1]) for x in f if x.startswith('VmHWM:')) / 2**10
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+    except (OSError, StopIteration, ValueError):
+        return None
+
+    return peak
+
+
+def begin(path, profile=()):
+    """Starts recording the stages of a run.
+
+    The report is written to <path>_Report.json and .csv, the profiles to
+    <path>_Profile_<stage>_<year>.prof.
+
+    Args:
+        path (str): Path prefix of the report, e.g. "output/Nevada".
+
+        profile (list): Names of the stages to run under cProfile.
+    """
+    global prefix, profiled, start
+
+    prefix, profiled, start = path, set(profile), time.time()
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    open(prefix + '_Report.jsonl', 'w').close()
+
+    atexit.register(finish)
+
+
+@contextlib.contextmanager
+def stage(name, year=None, season=None):
+    """Records a stage of the run.
+
+    Stages may be nested and inherit the year of the stage they run in. Once
+    a run is started by begin(), the outermost stages of each thread print
+    their duration. The recorded peak is the highest resident memory reached
+    while the stage ran, or where /proc is not available, how much the stage
+    raised the peak of the process.
+
+    Args:
+        name (str): Name of the stage, e.g. "ingest".
+
+        year (int): Year the stage works on, if any.
+
+        season (str): Season the stage works on, if any.
+
+    Yields:
+        dict: The record of the stage, set "rows" to report the number of
+              rows handled.
+    """
+    stack = local.__dict__.setdefault('stack', [])
+    if year is None and stack:
+        year = stack[-1]['year']
+
+    record = {'stage': name, 'year': year, 'season': season, 'depth': len(stack), 'pid': os.getpid(),
+        'thread': threading.current_thread().name, 'rows': None, 'started': round(time.time() - start, 4)}
+
+    profiler = None
+    if name in profiled:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # the process peak is reset for this stage, the stages still open keep the peak reached so far
+    held = {'peak': 0.0}
+    with lock:
+        peak = memory(reset=True)
+        for x in opened:
+            x['peak'] = max(x['peak'], peak or 0.0)
+        opened.append(held)
+
+    cpu, before = usage()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2**10
+    wall = time.perf_counter()
+    stack.append(record)
+    try:
+        yield record
+    finally:
+        stack.pop()
+        wall = time.perf_counter() - wall
+        if profiler is not None:
+            profiler.disable()
+            tags = [str(x) for x in [name, year, season] if x is not None]
+            profiler.dump_stats(prefix + '_Profile_' + '_'.join(tags) + '.prof')
+
+        now, after = usage()
+        with lock:
+            opened[:] = [x for x in opened if x is not held]
+            peak = memory()
+            peak = after - before if peak is None else max(held['peak'], peak)
+
+        # workers that finished during the stage and raised the peak of the reaped children
+        if resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2**10 > children:
+            peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2**10)
+
+        record.update({'wall_seconds': round(wall, 4), 'cpu_seconds': round(now - cpu, 4),
+            'peak_rss_mb': round(peak, 2)})
+
+        if prefix is not None:
+            with open(prefix + '_Report.jsonl', 'a') as f:
+                f.write(json.dumps(record, default=int) + '\n')
+
+        if record['depth'] == 0 and prefix is not None:
+            print((name[0].upper() + name[1:]).replace('_', ' '), *([] if year is None else [year]), "completed in",
+                round(wall, 3), "seconds (peak memory " + str(round(peak)) + " MB).\n")
+
+
+def records():
+    """Reads the stages recorded so far by every process of the run.
+
+    Returns:
+        list: One dict per stage in order of completion.
+    """
+    with open(prefix + '_Report.jsonl') as f:
+        return [json.loads(x) for x in f if x.strip()]
+
+
+def finish():
+    """Writes the .json and .csv run report of the recorded stages."""
+    global prefix
+
+    if prefix is None:
+        return
+
+    stages = records()
+    cpu, peak = usage()
+    report = {'argv': sys.argv[1:], 'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start)),
+        'wall_seconds': round(time.time() - start, 4), 'cpu_seconds': round(cpu, 4), 'peak_rss_mb': round(peak, 2),
+        'stages': stages}
+
+    cache.write(prefix + '_Report.json', lambda f: json.dump(report, f, indent=1), 'w')
+    cache.write(prefix + '_Report.csv', lambda f: pd.DataFrame(stages).convert_dtypes().to_csv(f, index=False), 'w')
+
+    prefix = None
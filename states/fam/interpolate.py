@@ -0,0 +1,101 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : interpolate.py
+# description     : Vectorized gap filling of the fields x dates ndvi matrix. Reproduces pandas linear interpolation
+#                   along rows with limit_direction='both' (edges take the nearest valid value) while working on
+#                   blocks of rows at once instead of one series at a time. Years are then constrained to their 8
+#                   day interval dates, as the state scripts and the benchmark format them.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import numpy as np
+import pandas as pd
+
+from fam import ingest
+
+# rows interpolated at once, bounds temporary memory to a few times chunk x dates
+CHUNK = 65536
+
+
+def fill(ndvi, chunk=CHUNK, columns=None):
+    """Linearly interpolates missing values along each row.
+
+    Interior gaps are filled on a straight line between the neighbouring valid
+    values, using the same arithmetic as numpy.interp so results are bit for
+    bit identical to DataFrame.interpolate(method='linear', axis=1,
+    limit_direction='both'). Leading and trailing gaps take the nearest valid
+    value and rows without any valid value are left missing.
+
+    Args:
+        ndvi (ndarray): A 2-D float array of fields x dates, filled in place.
+
+        chunk (int): Number of rows processed at once.
+
+        columns (ndarray): Optional column indices to restrict the count of
+                           filled values to. Defaults to every column.
+
+    Returns:
+        tuple: The filled array (ndarray) and the number of values filled in
+               each row (ndarray).
+    """
+    n, m = ndvi.shape
+    pos = np.arange(m)
+    filled = np.zeros(n, dtype=np.int32)
+
+    for lo in range(0, n, chunk):
+        block = ndvi[lo:lo+chunk]
+        missing = np.isnan(block)
+
+        if not missing.any():
+            continue
+
+        # nearest valid position to the left and right of every cell
+        left = np.maximum.accumulate(np.where(missing, -1, pos), axis=1)
+        right = np.minimum.accumulate(np.where(missing, m, pos)[:, ::-1], axis=1)[:, ::-1]
+
+        y_left = np.take_along_axis(block, np.clip(left, 0, m-1), axis=1)
+        y_right = np.take_along_axis(block, np.clip(right, 0, m-1), axis=1)
+
+        # straight line between neighbours, constant beyond the edges
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = (y_right - y_left) / (right - left)
+            line = slope*(pos - left) + y_left
+
+        line = np.where(left < 0, y_right, np.where(right >= m, y_left, line))
+        block[missing] = line[missing]
+
+        counted = missing & ~np.isnan(block)
+        filled[lo:lo+chunk] = (counted if columns is None else counted[:, columns]).sum(axis=1)
+
+    return ndvi, filled
+
+
+def intervals(ids, cols, ndvi, year):
+    """Interpolates a year and constrains it to its 8 day interval dates.
+
+    Args:
+        ids (ndarray): Ids of the rows, see ingest.grid().
+
+        cols (ndarray): Sorted date strings of the columns.
+
+        ndvi (ndarray): The ids x dates matrix of maxima, filled in place.
+
+        year (int): Corresponding year to input data.
+
+    Returns:
+        tuple: A pandas object indexed by id with the 46 interval dates of
+               every field with a complete series (DataFrame) and the number
+               of interval values filled in each of its rows (ndarray).
+    """
+    dates = ingest.dates(year)
+    interval = np.searchsorted(cols, dates)
+
+    # linearly interpolate by id
+    ndvi, filled = fill(ndvi, columns=interval)
+
+    # constrain data to 8 day intervals
+    df = pd.DataFrame(ndvi[:, interval], index=pd.Index(ids, name='id'), columns=dates)
+    kept = df.notna().all(axis=1).values
+
+    return df[kept], filled[kept]
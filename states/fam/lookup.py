@@ -0,0 +1,131 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : lookup.py
+# description     : Classification of a few fields on request. Every classifying run of a state script keeps its
+#                   settings (cache layout, reference years, common fields and thresholds) next to its cache, and each
+#                   request reads only the rows of the requested fields from the cached year and the baseline tables
+#                   and applies the shared fallow mapping rules, so single parcels are classified in milliseconds
+#                   instead of running the statewide script and searching its exports.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import json
+import functools
+
+import numpy as np
+
+from fam import align, baseline, cache, compact, crops, features, mapping
+
+# settings of the last classifying run, relative to the state folder
+SETTINGS = os.path.join('cache', 'lookup.json')
+
+
+def record(path, run, refs):
+    """Keeps the settings of a classifying run for later lookups.
+
+    The reference years of years classified by earlier runs are kept.
+
+    Args:
+        path (str): Path to the settings, see SETTINGS.
+
+        run (dict): Settings of the run: the cache entry prefix ("entry"),
+                    the common years ("common", None if fields are not
+                    limited to them) and their alignment mode ("align"),
+                    the bounds of a single growing season ("season", None
+                    for a spring and a summer season masking perennials),
+                    whether exports are compact ("compact") and the
+                    thresholds ("thresholds").
+
+        refs (dict): Reference years of each classified year.
+    """
+    try:
+        with open(path) as f:
+            kept = json.load(f)['refs']
+    except (OSError, ValueError, KeyError):
+        kept = {}
+
+    kept.update({str(x): [int(y) for y in v] for x, v in refs.items()})
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    cache.write(path, lambda f: json.dump(dict(run, refs=kept), f, indent=1), 'w')
+
+
+@functools.lru_cache(maxsize=None)
+def settings(path, stamp):
+    """Reads the settings kept by a classifying run.
+
+    Args:
+        path (str): Path to the settings, see SETTINGS.
+
+        stamp (int): Modification time of the file, a new run reloads them.
+
+    Returns:
+        dict: Output of record().
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def fields(script, year, ids):
+    """Classifies a few fields of a year.
+
+    The year and the reference years of its baseline must have been cached
+    and classified by a run of the state script, whose settings are used.
+    Fields missing from the cached year, or outside the common fields of
+    California, are left out.
+
+    Args:
+        script (str): Path to a FAM_<State>.py script, or its folder.
+
+        year (int): Classified year.
+
+        ids (list): Field ids to classify.
+
+    Returns:
+        dict: Season name to a pandas object indexed by id with the field
+              status, the percent of the historic average and the season
+              features of each field.
+    """
+    root = script if os.path.isdir(script) else os.path.dirname(os.path.abspath(script))
+    path = os.path.join(root, SETTINGS)
+    if not os.path.exists(path):
+        raise ValueError("no classifying run found in " + root + ", run the state script first")
+
+    run = settings(path, os.stat(path).st_mtime_ns)
+    if str(year) not in run['refs']:
+        raise ValueError(str(year) + " was not classified, run the state script for it first")
+
+    entry = lambda x: os.path.join(root, run['entry'] + str(x))
+
+    df = cache.rows(entry(year), ids)
+    if df is None:
+        raise ValueError(str(year) + " is not cached, run the state script first")
+
+    # every california year is limited to the fields of the common years
+    if run['common'] is not None:
+        common = align.index(os.path.join(root, 'cache', 'common'), [entry(x) for x in run['common']], run['align'])
+        pos = np.searchsorted(common, df.index.values).clip(0, max(len(common)-1, 0))
+        df = df[common[pos] == df.index.values] if len(common) else df.iloc[:0]
+
+    hist = baseline.derive([entry(x) for x in run['refs'][str(year)]], df.index)
+
+    # nevada classifies a single growing season, the other states a spring and a summer season
+    if run['season'] is not None:
+        bounds = {'season': tuple(run['season'])}
+        fam = [mapping.growingSeason(df, hist['year'], run['thresholds'], bounds['season'])]
+    else:
+        bounds = features.SEASONS
+        table = crops.table(crops.source(os.path.join(root, 'input', 'crop_data'), year),
+            os.path.join(root, 'cache', 'crops'))
+        fam = mapping.postProcess(df, hist, run['thresholds'], crops.mask(table, df.index.values))
+
+    # compact exports carry int16 statuses and float32 values
+    if run['compact']:
+        fam = [compact.shrink(x) for x in fam]
+
+    names = list(bounds) if run['season'] is not None else ['spring', 'summer']
+    feats = features.seasons(df.values, bounds)
+
+    return {x: fam[k][['field_status', 'percent_5yr_Avg']].assign(**feats[x]) for k, x in enumerate(names)}
@@ -0,0 +1,193 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : mapping.py
+# description     : Fallow mapping rules shared by the state scripts and field lookups. The hierarchical rules of a
+#                   season are applied to its features and historic maximum, statuses are decoded to cdl codes and,
+#                   for states with a spring and a summer season, reconciled with the overlap period by the date of
+#                   the maximum smoothed ndvi.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import numpy as np
+import pandas as pd
+
+from fam import features, instrument, rules
+
+# field status                        cdl
+crp = 5 # cropped                     -> 2
+flw = 4 # fallow                      -> 10
+prn = 3 # perennial, no crop yet      -> 15
+pin = 2 # partially irrigated normal  -> 8
+pop = 1 # partially irrigated poor    -> 9
+
+# first summer column of the year, fields cropped in the overlap period join the season of their maximum
+SPLIT = 19
+
+# ________________________________________DATE CONVERSION_________________________________________
+#|01-01|01-09|01-17|01-25|02-02|02-10|02-18|02-26|03-06|03-14|03-22|03-30|04-07|04-15|04-23|05-01|
+#|  0  |  1  |  2  |  3  |  4  |  5  |  6  |  7  |  8  |  9  |  10 |  11 |  12 |  13 |  14 |  15 |
+#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
+#|05-09|05-17|05-25|06-02|06-10|06-18|06-26|07-04|07-12|07-20|07-28|08-05|08-13|08-21|08-29|09-06|
+#|  16 |  17 |  18 |  19 |  20 |  21 |  22 |  23 |  24 |  25 |  26 |  27 |  28 |  29 |  30 |  31 |
+#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
+#|09-14|09-22|09-30|10-08|10-16|10-24|11-01|11-09|11-17|11-25|12-03|12-11|12-19|12-27|     |     |
+#|  32 |  33 |  34 |  35 |  36 |  37 |  38 |  39 |  40 |  41 |  42 |  43 |  44 |  45 |     |     |
+#|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|_____|
+
+
+def decode(field_status):
+    """Maps field status to standard cdl code.
+
+    Uses a series of vectorized operations to sequentially map input to
+    corresponding cdl code.
+
+    Args:
+        field_status (ndarray): An array object containing hierarchical
+        field codes.
+
+    Returns:
+        ndarray: Mapped values to corresponding cdl code.
+    """
+    field_status = np.where(field_status == pin, 8, field_status)
+    field_status = np.where(field_status == pop, 9, field_status)
+    field_status = np.where(field_status == flw, 10, field_status)
+    field_status = np.where(field_status == crp, 2, field_status)
+
+    # perennials cannot be partially irrigated (summer only)
+    field_status = np.where(field_status == prn, 2, field_status)
+
+    return field_status
+
+
+def fallowMapping(df, bounds, feats, max_smooth_5yr, thresholds, perennial=None):
+    """Performs initial classification results of a season.
+
+    Applies a series of rules to a period of the data. Rules perform
+    vectorized operations and are detailed in the comments. Assigned field
+    statuses are hierarchical in nature and must be later converted to
+    their respective cdl codes.
+
+    Args:
+        df (DataFrame): A pandas object which contains formatted ndvi time
+                        series data.
+
+        bounds (tuple): First and last (excluded) column of the season.
+
+        feats (dict): Season features of df as returned by features.seasons.
+
+        max_smooth_5yr (Series): Historic maximum of the season for each
+                                 field of df.
+
+        thresholds (dict): Threshold values by name, see sweep.THRESHOLDS.
+
+        perennial (ndarray): Optional perennial crop mask of df by position.
+
+    Returns:
+        DataFrame: A pandas object with classified times series data.
+    """
+    df = df.iloc[:, bounds[0]:bounds[1]]
+
+    # highest ndvi values from the original linearly interpolated ts
+    ndvi_max1 = pd.Series(feats['ndvi_max1'], index=df.index)
+    ndvi_max4 = pd.Series(feats['ndvi_max4'], index=df.index)
+
+    # highest ndvi values from the smoothed ts
+    ndvi_smoothed_max1 = pd.Series(feats['ndvi_smoothed_max1'], index=df.index)
+
+    # check cropped
+    rule1 = np.where(ndvi_max4 >= thresholds['ndvi_max_threshold'], crp, -9999)
+
+    # check fallow
+    rule3 = np.where(ndvi_max1 < thresholds['ndvi_min_threshold'], flw, -9999)
+
+    # check fields between 0.4 and 0.7 relative to historic average
+    rule4 = np.where(ndvi_smoothed_max1 >= (thresholds['ndvi_perc_historic_threshold1'] * max_smooth_5yr), pin, -9999)
+
+    # check for partially irrigated
+    rule5 = np.where(ndvi_smoothed_max1 >= (thresholds['ndvi_perc_historic_threshold2'] * max_smooth_5yr), pop, -9999)
+
+    # check for fields that are less than 50% of historical average
+    rule6 = np.where(ndvi_smoothed_max1 < (thresholds['ndvi_perc_historic_threshold2'] * max_smooth_5yr), flw, -9999)
+
+    # calculate percent 5 year average
+    pnorm = np.where(True, round(ndvi_smoothed_max1/max_smooth_5yr, 4)*100, -9999)
+
+    # mask for perennial croptype
+    rule2 = [] if perennial is None else [np.where(perennial, prn, -9999)]
+
+    # classify field status via hierarchical merge
+    field_status = np.maximum.reduce([rule1, *rule2, rule3, rule4, rule5, rule6])
+
+    # add classifications & historical averages
+    df.insert(0, 'field_status', field_status)
+    df.insert(0, 'percent_5yr_Avg', pnorm)
+
+    return df
+
+
+def postProcess(yr_df, max_smooth_5yr, thresholds, perennial):
+    """Classifies the spring and summer seasons of a year.
+
+    Compares the date of the max ndvi value with cropped observations in the
+    overlap period to reclassify observations as cropped, decodes statuses to
+    cdl codes and masks early season perennials.
+
+    Args:
+        yr_df (DataFrame): A pandas object which contains formatted ndvi time
+                           series data.
+
+        max_smooth_5yr (DataFrame): Historic maximums of yr_df as returned by
+                                    baseline.derive.
+
+        thresholds (dict): Threshold values by name, see sweep.THRESHOLDS.
+
+        perennial (ndarray): Perennial crop mask of yr_df by position.
+
+    Returns:
+        list: Contains two pandas DataFrame objects by season with final classified
+              results.
+    """
+    # season features from a single pass over the year
+    with instrument.stage('features'):
+        feats = features.seasons(yr_df.values)
+
+    # initial classifications, perennials only mask the summer
+    fam = {}
+    for season in ['spring', 'overlap', 'summer']:
+        with instrument.stage('fallowMapping', season=season):
+            fam[season] = fallowMapping(yr_df, features.SEASONS[season], feats[season], max_smooth_5yr[season],
+                thresholds, perennial if season == 'summer' else None)
+
+    # reconcile seasons with the overlap period by date of max ndvi, decode and mask early season perennials
+    with instrument.stage('postProcess'):
+        fam['spring']['field_status'], fam['summer']['field_status'] = rules.reconcile(
+            fam['spring']['field_status'].values, fam['summer']['field_status'].values,
+            fam['overlap']['field_status'].values, feats['year']['ndvi_smoothed_argmax'], SPLIT, crp, decode, perennial)
+
+    return [fam['spring'], fam['summer']]
+
+
+def growingSeason(df, max_smooth_5yr, thresholds, bounds):
+    """Classifies the single growing season of a year.
+
+    Args:
+        df (DataFrame): A pandas object which contains formatted ndvi time
+                        series data.
+
+        max_smooth_5yr (Series): Historic maximum of the full year for each
+                                 field of df.
+
+        thresholds (dict): Threshold values by name, see sweep.THRESHOLDS.
+
+        bounds (tuple): First and last (excluded) column of the season.
+
+    Returns:
+        DataFrame: A pandas object with the decoded field status first.
+    """
+    feats = features.seasons(df.values, {'season': bounds})['season']
+
+    df = fallowMapping(df, bounds, feats, max_smooth_5yr, thresholds)
+    df['field_status'] = decode(df['field_status'].values)
+
+    return df[['field_status', 'percent_5yr_Avg'] + list(df.columns[2:])]
@@ -0,0 +1,53 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : parallel.py
+# description     : Process pool execution of per year work. Workers are forked so they inherit the state of the
+#                   calling script (processed years, historic maximums, crop types) and hand their results back
+#                   through files, i.e. the memory-mapped cache and the output csvs, instead of pickled DataFrames.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import multiprocessing
+import concurrent.futures
+
+# task executed by forked workers, set before the pool is created
+task = None
+
+
+def call(item):
+    """Runs the current task on a single item inside a worker."""
+    task(item)
+
+
+def each(fn, items, workers=1):
+    """Applies a function to every item on a pool of forked processes.
+
+    Since workers are forked, fn may be any callable including lambdas and
+    functions defined in the calling script. Return values are discarded;
+    results must be written to disk by fn. A worker that dies, e.g. killed
+    for running out of memory, raises BrokenProcessPool instead of stalling.
+
+    Args:
+        fn (function): Called once per item.
+
+        items (list): Items to process, e.g. years.
+
+        workers (int): Number of processes. A value of 1 runs sequentially in
+                       the calling process.
+    """
+    global task
+
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for x in items:
+            fn(x)
+        return
+
+    task = fn
+    try:
+        with concurrent.futures.ProcessPoolExecutor(min(workers, len(items)),
+                mp_context=multiprocessing.get_context('fork')) as pool:
+            list(pool.map(call, items))
+    finally:
+        task = None
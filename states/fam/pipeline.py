@@ -0,0 +1,107 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : pipeline.py
+# description     : Pipelined execution of per year work. Years flow through a chain of stages (read, classify,
+#                   export) that each run on their own thread and are connected by bounded queues, so that the next
+#                   year is read while the current one is classified and the previous one is exported. A full queue
+#                   blocks the stage feeding it, which bounds memory to a few years.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import queue
+import threading
+
+# marks the end of the items passed between stages
+DONE = object()
+
+
+def order(targets, needs):
+    """Orders the years to read so that every target is ready early.
+
+    Each target is preceded by the years it needs that were not read yet, and
+    is released right after the last of them, so classification can start
+    before every year has been read.
+
+    Args:
+        targets (list): Years to classify, in the order they are wanted.
+
+        needs (function): Called as needs(year), returns the years a target
+                          depends on, including itself.
+
+    Returns:
+        list: Pairs of a year to read and the targets ready once it is read.
+    """
+    done, released, steps = set(), set(), []
+
+    for year in targets:
+        for x in sorted(set(needs(year)) - done):
+            done.add(x)
+            ready = [y for y in targets if y not in released and set(needs(y)) <= done]
+            released.update(ready)
+            steps.append((x, ready))
+
+    return steps
+
+
+def run(source, stages, depth=1):
+    """Passes items through a chain of stages, each on its own thread.
+
+    The source is consumed on a thread of its own, so it may do work of its
+    own, e.g. read a year before yielding it. Every stage is called with the
+    result of the previous one. Once a stage fails the remaining items are
+    drained without being processed and the error is raised.
+
+    Args:
+        source (iterable): Items fed to the first stage, e.g. a generator.
+
+        stages (list): Functions called once per item.
+
+        depth (int): Items held between two stages, a full queue blocks the
+                     stage feeding it.
+    """
+    queues = [queue.Queue(depth) for x in stages]
+    failed = threading.Event()
+    errors = []
+
+    def feed():
+        try:
+            for x in source:
+                if failed.is_set():
+                    break
+                queues[0].put(x)
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+        queues[0].put(DONE)
+
+    def work(fn, inbox, outbox):
+        while True:
+            x = inbox.get()
+            if x is DONE:
+                break
+            if failed.is_set():
+                continue
+            try:
+                x = fn(x)
+            except BaseException as e:
+                errors.append(e)
+                failed.set()
+                continue
+            if outbox is not None:
+                outbox.put(x)
+
+        if outbox is not None:
+            outbox.put(DONE)
+
+    threads = [threading.Thread(target=feed, name='source')] + [threading.Thread(target=work,
+        args=(fn, queues[k], queues[k+1] if k+1 < len(stages) else None), name=getattr(fn, '__name__', str(k)))
+        for k, fn in enumerate(stages)]
+
+    for x in threads:
+        x.start()
+    for x in threads:
+        x.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,57 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : rules.py
+# description     : Array form of the post-processing rules. Spring and summer statuses are reconciled with the
+#                   overlap period by comparing the column index of the maximum smoothed ndvi with the season bounds,
+#                   and decoding and the perennial mask are applied in the same pass, for single classifications as
+#                   well as blocks of threshold combinations.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import numpy as np
+
+
+def reconcile(spring, summer, overlap, argmax, split, crp, decode, perennial=None, code=15):
+    """Reclassifies spring and summer from the overlap period.
+
+    A field cropped in the overlap period is cropped in spring if its
+    maximum smoothed ndvi falls before the split column and cropped in
+    summer otherwise. Statuses are then decoded and early season perennials
+    take their own code in spring.
+
+    Args:
+        spring (ndarray): Spring field status levels, fields on the last axis.
+
+        summer (ndarray): Summer field status levels, same shape as spring.
+
+        overlap (ndarray): Overlap period field status levels, same shape.
+
+        argmax (ndarray): Column index of the maximum smoothed ndvi of the
+                          year for each field.
+
+        split (int): First summer column of the year.
+
+        crp (int): Level of cropped fields.
+
+        decode (function): Maps levels to their final codes.
+
+        perennial (ndarray): Optional perennial crop mask by position.
+
+        code (int): Final code of early season perennials.
+
+    Returns:
+        tuple: Final spring and summer codes (ndarray).
+    """
+    cropped = overlap == crp
+    early = argmax < split
+
+    # max ndvi observation in season and cropped in overlap period
+    spring = decode(np.where(cropped & early, crp, spring))
+    summer = decode(np.where(cropped & ~early, crp, summer))
+
+    # mask for early season perennials (spring only)
+    if perennial is not None:
+        spring = np.where(perennial, code, spring)
+
+    return spring, summer
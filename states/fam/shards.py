@@ -0,0 +1,220 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : shards.py
+# description     : Out-of-core execution by field shards. Fields are partitioned into id ranges, the raw csvs are
+#                   spilled once into per shard .npz parts and every shard is run as its own copy of the state
+#                   script (ingest, historic maximums, classification and export) in a workspace laid out like a
+#                   state directory. The shard exports are concatenated in id order afterwards, giving the same
+#                   files as an unsharded run while only one shard is held in memory at a time.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import sys
+import glob
+import json
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from fam import cache, columnar, ingest
+
+# workspace holding the spilled inputs, caches and exports of every shard
+ROOT = 'cache/shards'
+
+# spilled part carrying the column layout of the whole year
+LAYOUT = 'layout.npz'
+
+# perennial crop tables, shared and per year, split alongside the inputs
+CROPS = 'input/crop_data/perennial*.csv'
+
+
+def bounds(files, size):
+    """Partitions the field ids of the input files into ranges.
+
+    Args:
+        files (list): A list of .csv files.
+
+        size (int): Target number of fields per shard.
+
+    Returns:
+        list: Half open [low, high) id ranges in increasing order.
+    """
+    ids = np.unique(np.concatenate([np.unique(pd.read_csv(x, usecols=[2], header=0, names=['id'],
+        dtype={'id': np.int64})['id'].to_numpy()) for x in files]))
+
+    lows = ids[::size].tolist()
+    highs = lows[1:] + [int(ids[-1]) + 1]
+
+    return [[int(a), int(b)] for a, b in zip(lows, highs)]
+
+
+def folder(k):
+    """Workspace of a shard, laid out like a state directory."""
+    return os.path.join(ROOT, 'shard_' + str(k))
+
+
+def split(files, year, ranges):
+    """Spills the raw csvs of a year into per shard .npz parts.
+
+    Every file is parsed once. The column layout is computed over all fields
+    of the year and stored with every shard so that shards interpolate over
+    exactly the same dates as an unsharded run.
+
+    Args:
+        files (list): A list of .csv files for the year.
+
+        year (int): Corresponding year to input data.
+
+        ranges (list): Output of bounds().
+    """
+    lows = np.array([a for a, b in ranges])
+    summaries = []
+
+    # clear parts of a previous split
+    for k in range(len(ranges)):
+        for x in glob.glob(os.path.join(folder(k), 'input', str(year), '*.npz')):
+            os.remove(x)
+
+    for x, part in zip(files, ingest.stream(files)):
+        summaries.append(ingest.summary(part))
+
+        # group observations by shard without sorting the values
+        shard = (np.searchsorted(lows, part[1], side='right') - 1).astype(np.int16)
+        order = np.argsort(shard, kind='stable')
+        edges = np.concatenate([[0], np.cumsum(np.bincount(shard, minlength=len(ranges)))])
+
+        for k in range(len(ranges)):
+            sel = order[edges[k]:edges[k+1]]
+            path = os.path.join(folder(k), 'input', str(year))
+            os.makedirs(path, exist_ok=True)
+
+            cache.write(os.path.join(path, os.path.basename(x)[:-4] + '.npz'), lambda f: np.savez(f,
+                ndvi=part[0][sel], id=part[1][sel], codes=part[2][sel], uniques=part[3].astype(str)))
+
+    cols, drop = ingest.layout(summaries, year)
+
+    for k in range(len(ranges)):
+        path = os.path.join(folder(k), 'input', str(year))
+        os.makedirs(path, exist_ok=True)
+
+        # an empty part, so the layout is fingerprinted with the shard inputs
+        cache.write(os.path.join(path, LAYOUT), lambda f: np.savez(f, ndvi=np.zeros(0),
+            id=np.zeros(0, dtype=np.int64), codes=np.zeros(0, dtype=np.int32), uniques=np.zeros(0, dtype=str),
+            cols=cols, drop_id=drop[0], drop_date=drop[1]))
+
+
+def layout(files):
+    """Reads the year wide column layout of spilled shard inputs.
+
+    Args:
+        files (list): Input files of a year, either raw .csv files or spilled
+                      .npz parts.
+
+    Returns:
+        tuple: Column layout for ingest.grid, or None for raw .csv files.
+    """
+    for x in files:
+        if os.path.basename(x) == LAYOUT:
+            with np.load(x) as f:
+                return f['cols'], (int(f['drop_id']), str(f['drop_date']))
+
+    return None
+
+
+def merge(ranges):
+    """Concatenates the exports of every shard into the output folder.
+
+    Args:
+        ranges (list): Output of bounds().
+    """
+    # run reports stay with their shard
+    names = sorted(set(os.path.basename(x) for k in range(len(ranges))
+        for x in glob.glob(os.path.join(folder(k), 'output', '*.csv')) if not x.endswith('_Report.csv')))
+
+    for name in names:
+        def writer(out):
+            header = None
+            for k in range(len(ranges)):
+                path = os.path.join(folder(k), 'output', name)
+                if not os.path.exists(path):
+                    continue
+                with open(path) as f:
+                    first = f.readline()
+                    if header is None:
+                        header = first
+                        out.write(first)
+                    for line in f:
+                        out.write(line)
+
+        cache.write(os.path.join('output', name), writer, 'w')
+
+    # columnar partitions are read whole and written once
+    parts = sorted(set(os.path.relpath(x, folder(k)) for k in range(len(ranges))
+        for x in glob.glob(os.path.join(folder(k), 'output', 'state=*', '*', '*', 'part.*'))))
+
+    for x in parts:
+        name, fmt = os.path.splitext(x)
+        frames = [columnar.read(os.path.join(folder(k), name), fmt[1:]) for k in range(len(ranges))
+            if os.path.exists(os.path.join(folder(k), x))]
+        columnar.write(pd.concat(frames), name, fmt[1:])
+
+
+def run(script, years, select, size, argv):
+    """Runs a state script shard by shard and merges the exports.
+
+    Args:
+        script (str): Absolute path of the state script.
+
+        years (list): Years processed by the script.
+
+        select (function): Returns the input files of a year.
+
+        size (int): Target number of fields per shard.
+
+        argv (list): Command line options passed on to every shard.
+    """
+    os.makedirs(ROOT, exist_ok=True)
+
+    # id ranges, recomputed only when the inputs or the shard size change
+    files = sorted(x for year in years for x in select(year))
+    key = cache.fingerprint(files, os.path.join(ROOT, 'inputs' + cache.MEMO)) + ':' + str(size)
+    state = {}
+    if os.path.exists(os.path.join(ROOT, 'shards.json')):
+        with open(os.path.join(ROOT, 'shards.json')) as f:
+            state = json.load(f)
+
+    if state.get('key') != key:
+        state = {'key': key, 'ranges': bounds(files, size), 'years': {}}
+
+    ranges = state['ranges']
+    print("Running", len(ranges), "shards of up to", size, "fields.\n")
+
+    # spill years whose inputs changed
+    for year in years:
+        year_key = cache.fingerprint(select(year), os.path.join(ROOT, str(year) + cache.MEMO))
+        if state['years'].get(str(year)) != year_key:
+            print("Splitting", year, "into shards.\n")
+            split(select(year), year, ranges)
+            state['years'][str(year)] = year_key
+            cache.write(os.path.join(ROOT, 'shards.json'), lambda f: json.dump(state, f), 'w')
+
+    # perennial crop types restricted to each shard
+    for table in glob.glob(CROPS):
+        crops = pd.read_csv(table)
+        for k, (a, b) in enumerate(ranges):
+            path = os.path.join(folder(k), table)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            part = crops[(crops['id'] >= a) & (crops['id'] < b)]
+            cache.write(path, lambda f: part.to_csv(f, index=False), 'w')
+
+    for k in range(len(ranges)):
+        for x in ['cache', 'output']:
+            os.makedirs(os.path.join(folder(k), x), exist_ok=True)
+
+        print("Shard", k+1, "of", len(ranges), "ids", ranges[k][0], "to", ranges[k][1]-1, "\n")
+        subprocess.run([sys.executable, script] + argv, cwd=folder(k), check=True)
+
+    merge(ranges)
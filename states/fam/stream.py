@@ -0,0 +1,204 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : stream.py
+# description     : Intra-season updates of a cached year. The raw observation maxima of a streamed year are kept
+#                   next to its cache entry so that a newly arrived 8 day composite is scattered into them in place,
+#                   only the fields it touches are interpolated again, row by row, and the cached year, its baseline
+#                   table and the exports are patched for the fields whose cached series changed.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from fam import baseline, cache, ingest, interpolate
+
+# suffixes of the raw observation maxima, their ids and their layout
+RAW = '.raw.npy'
+IDS = '.raw.id.npy'
+META = '.raw.json'
+
+
+def build(raw, ids, cols, year, drop):
+    """Interpolates a block of raw rows onto the 8 day interval dates.
+
+    Args:
+        raw (ndarray): Rows of the matrix of maxima, see ingest.accumulate().
+
+        ids (ndarray): Sorted ids of the rows.
+
+        cols (ndarray): Sorted date strings of the columns.
+
+        year (int): Corresponding year to input data.
+
+        drop (tuple): The (id, date) cell to clear.
+
+    Returns:
+        ndarray: The rows x 46 dates ndvi matrix, missing for rows without
+                 any valid observation.
+    """
+    ndvi = ingest.finish(np.array(raw), ids, cols, year, drop)
+    ndvi, filled = interpolate.fill(ndvi)
+
+    return ndvi[:, np.searchsorted(cols, ingest.dates(year))]
+
+
+def rebase(path, files, year, compact=False, threads=ingest.THREADS):
+    """Processes a full year and keeps its raw observations for later updates.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        files (list): A list of .csv files for the year.
+
+        year (int): Corresponding year to input data.
+
+        compact (bool): Read and store the year in the compact dtypes.
+
+        threads (int): Number of files parsed at once.
+    """
+    print("Stream rebase: processing", year)
+
+    parts = ingest.load(files, compact, threads)
+    cols, drop = ingest.layout([ingest.summary(x) for x in parts], year)
+    ids = np.unique(np.concatenate([x[1] for x in parts]))
+    raw = ingest.accumulate(parts, ids, cols)
+
+    key = cache.fingerprint(files, path + cache.MEMO)
+    if os.path.exists(path + META):
+        os.remove(path + META)
+
+    cache.write(path + RAW, lambda f: np.save(f, raw))
+    cache.write(path + IDS, lambda f: np.save(f, ids))
+
+    ndvi = build(raw, ids, cols, year, drop)
+    kept = ~np.isnan(ndvi).any(axis=1)
+    df = pd.DataFrame(ndvi[kept], index=pd.Index(ids[kept], name='id'), columns=ingest.dates(year))
+    cache.store(path, key, df)
+
+    meta = {'key': key, 'cols': [str(x) for x in cols], 'drop': [int(drop[0]), str(drop[1])]}
+    cache.write(path + META, lambda f: json.dump(meta, f), 'w')
+
+
+def fits(parts, ids, cols, drop):
+    """Checks whether new observations fit the layout of the stored year.
+
+    Args:
+        parts (list): Output of ingest.read() for each new file.
+
+        ids (ndarray): Sorted ids of the stored rows.
+
+        cols (ndarray): Sorted date strings of the stored columns.
+
+        drop (tuple): The stored (id, date) cell to clear.
+
+    Returns:
+        bool: True if every observation falls on a stored row and column and
+              none precedes the dropped cell.
+    """
+    for values, id_, codes, uniques in parts:
+        if not len(id_):
+            continue
+
+        used = uniques[np.unique(codes)].astype(str)
+        if not np.isin(used, cols).all() or not np.isin(id_, ids).all():
+            return False
+
+        first = id_.min()
+        if first < drop[0] or (first == drop[0] and uniques[codes[id_ == first]].astype(str).min() < drop[1]):
+            return False
+
+    return True
+
+
+def append(path, files, new, year, compact=False, threads=ingest.THREADS):
+    """Folds newly arrived observations into a cached year in place.
+
+    The new observations are scattered into the stored raw maxima and only
+    the rows they touch are interpolated again, each in full since a new
+    observation moves the interpolation up to its neighbouring observations.
+    Rows whose cached series changed are overwritten in place in the cached
+    year and its baseline table, and the entry is rekeyed to the new set of
+    files. The update is row level, every changed field is classified and
+    exported again as a whole because the exports hold its full series. The
+    year is processed in full instead, the first time it is streamed, when
+    its stored state does not match the other files, or when the new
+    observations change its layout or field set.
+
+    Args:
+        path (str): Cache entry prefix, e.g. "cache/yr_2019".
+
+        files (list): A list of .csv files for the year, including new ones.
+
+        new (list): The newly arrived files.
+
+        year (int): Corresponding year to input data.
+
+        compact (bool): Read and store the year in the compact dtypes.
+
+        threads (int): Number of files parsed at once.
+
+    Returns:
+        ndarray: Ids of the fields whose interpolated series changed, or None
+                 if the year was processed in full.
+    """
+    old = [x for x in files if x not in new]
+
+    try:
+        with open(path + META) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = None
+
+    if meta is None or meta['key'] != cache.key(path) or meta['key'] != cache.fingerprint(old, path + cache.MEMO):
+        rebase(path, files, year, compact, threads)
+        return None
+
+    cols, drop = np.array(meta['cols']), (meta['drop'][0], meta['drop'][1])
+    ids = np.load(path + IDS)
+    parts = ingest.load(new, compact, threads)
+
+    if not fits(parts, ids, cols, drop):
+        rebase(path, files, year, compact, threads)
+        return None
+
+    raw = np.load(path + RAW, mmap_mode='r+')
+    rows = np.unique(np.searchsorted(ids, np.concatenate([x[1] for x in parts] + [ids[:0]])))
+
+    # scatter into the stored maxima, duplicates resolve as in a full run
+    ingest.accumulate(parts, ids, cols, out=raw)
+    raw.flush()
+    after = build(raw[rows], ids[rows], cols, year, drop)
+
+    key = cache.fingerprint(files, path + cache.MEMO)
+
+    # fields appearing in or vanishing from the year change its row set
+    cached = np.load(path + '.id.npy')
+    pos = np.searchsorted(cached, ids[rows]).clip(0, len(cached)-1)
+    present = cached[pos] == ids[rows]
+    kept = ~np.isnan(after).any(axis=1)
+
+    if (present != kept).any():
+        rebase(path, files, year, compact, threads)
+        return None
+
+    # the cached rows hold the series before the update, only fields whose stored series moved are patched
+    ndvi = np.load(path + '.ndvi.npy', mmap_mode='r+')
+    new = after[kept].astype(ndvi.dtype)
+    moved = (ndvi[pos[kept]] != new).any(axis=1)
+    ndvi[pos[kept][moved]] = new[moved]
+    ndvi.flush()
+
+    baseline.patch(path, key, ids[rows][kept][moved], new[moved])
+    cache.rekey(path, key)
+
+    meta['key'] = key
+    cache.write(path + META, lambda f: json.dump(meta, f), 'w')
+
+    # exports hold the series as well, so every field whose series moved is classified again
+    return ids[rows][kept][moved]
+
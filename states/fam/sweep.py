@@ -0,0 +1,182 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : sweep.py
+# description     : Threshold sweep engine for tuning the classification. The per field season features and historic
+#                   baselines of a year are computed once and the hierarchical rules of fallowMapping and postProcess
+#                   are evaluated for blocks of threshold combinations at a time, returning class counts and acreage
+#                   for every combination instead of a classified export.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import numpy as np
+import pandas as pd
+
+from fam import rules
+
+# tunable thresholds, named as in the state scripts
+THRESHOLDS = ['ndvi_max_threshold', 'ndvi_min_threshold', 'ndvi_perc_historic_threshold1',
+    'ndvi_perc_historic_threshold2']
+
+# final classes as cdl codes
+CLASSES = {'cropped': 2, 'fallow': 10, 'partial_normal': 8, 'partial_poor': 9, 'perennial': 15,
+    'unclassified': -9999}
+
+# field status levels of the hierarchical merge, 0 when no rule applies
+crp = 5 # cropped                     -> 2
+flw = 4 # fallow                      -> 10
+prn = 3 # perennial, no crop yet      -> 2
+pin = 2 # partially irrigated normal  -> 8
+pop = 1 # partially irrigated poor    -> 9
+
+# position in CLASSES of each level, perennials without crop count as cropped
+DECODE = np.array([5, 3, 2, 0, 1, 0], dtype=np.int8)
+
+# threshold combinations evaluated at once, bounds temporary memory to a few bytes x chunk x fields
+CHUNK = 16
+
+
+def grid(**axes):
+    """Builds every combination of the given threshold values.
+
+    Args:
+        **axes (list): Values of each threshold, keyed by its name.
+
+    Returns:
+        DataFrame: A pandas object with one row per combination.
+    """
+    mesh = np.meshgrid(*[np.asarray(x, dtype=np.float64) for x in axes.values()], indexing='ij')
+
+    return pd.DataFrame({x: m.ravel() for x, m in zip(axes, mesh)})
+
+
+def read(path, defaults):
+    """Reads threshold combinations from a .csv file.
+
+    Args:
+        path (str): Path to a .csv file with a column per swept threshold.
+
+        defaults (dict): Values of the thresholds missing from the file.
+
+    Returns:
+        DataFrame: A pandas object with one row per combination.
+    """
+    combos = pd.read_csv(path)
+    for x in THRESHOLDS:
+        if x not in combos:
+            combos[x] = defaults[x]
+
+    return combos[THRESHOLDS].astype(np.float64)
+
+
+def areas(path, ids):
+    """Reads field areas aligned to the fields of a year.
+
+    Args:
+        path (str): Path to a .csv file of ids and areas, e.g. in acres.
+
+        ids (Index): Field ids of the year.
+
+    Returns:
+        ndarray: Area of every field, 0 for fields without one.
+    """
+    area = pd.read_csv(path).set_index('id').iloc[:, 0]
+
+    return area.reindex(ids).fillna(0).to_numpy(dtype=np.float64)
+
+
+def levels(feats, hist, t, perennial=None):
+    """Applies the rules of a season to a block of combinations.
+
+    Args:
+        feats (dict): Features of the season as returned by features.seasons.
+
+        hist (ndarray): Historic maximum of the season for each field.
+
+        t (dict): Threshold name to an array of values, one per combination.
+
+        perennial (ndarray): Optional perennial crop mask by position.
+
+    Returns:
+        ndarray: A combinations x fields int8 array of field status levels.
+    """
+    col = lambda x: t[x][:, None]
+    smoothed = feats['ndvi_smoothed_max1']
+
+    # check cropped
+    lvl = (feats['ndvi_max4'] >= col('ndvi_max_threshold')) * np.int8(crp)
+
+    # check fallow
+    np.maximum(lvl, (feats['ndvi_max1'] < col('ndvi_min_threshold')) * np.int8(flw), out=lvl)
+
+    # check fields relative to historic average, partially irrigated and less than historic average
+    np.maximum(lvl, (smoothed >= col('ndvi_perc_historic_threshold1')*hist) * np.int8(pin), out=lvl)
+    np.maximum(lvl, (smoothed >= col('ndvi_perc_historic_threshold2')*hist) * np.int8(pop), out=lvl)
+    np.maximum(lvl, (smoothed < col('ndvi_perc_historic_threshold2')*hist) * np.int8(flw), out=lvl)
+
+    # mask for perennial croptype
+    if perennial is not None:
+        np.maximum(lvl, perennial * np.int8(prn), out=lvl)
+
+    return lvl
+
+
+def sweep(feats, hist, combos, perennial=None, area=None, split=None, chunk=CHUNK):
+    """Evaluates threshold combinations on the features of a year.
+
+    Seasons are classified as in fallowMapping. Given a split, spring and
+    summer are reconciled with the overlap period and the date of the
+    maximum smoothed ndvi as in postProcess. A perennial mask is applied to
+    summer as a rule and, when reconciling, overrides spring.
+
+    Args:
+        feats (dict): Season features of a year as returned by
+                      features.seasons. The overlap and year entries only
+                      serve the reconciliation and are not reported.
+
+        hist (dict): Season name to the historic maximum of each field.
+
+        combos (DataFrame): Threshold combinations, see grid() and read().
+
+        perennial (ndarray): Optional perennial crop mask by position.
+
+        area (ndarray): Optional area of each field.
+
+        split (int): First summer column of the year. Enables the overlap
+                     reconciliation of spring and summer.
+
+        chunk (int): Number of combinations evaluated at once.
+
+    Returns:
+        DataFrame: The combinations with the number of fields, and area if
+                   given, of every season and class.
+    """
+    seasons = [x for x in feats if x not in ('overlap', 'year')]
+    reconcile = split is not None and 'overlap' in feats
+    argmax = feats['year']['ndvi_smoothed_argmax'] if reconcile else None
+
+    out = {}
+    for lo in range(0, len(combos), chunk):
+        t = {x: combos[x].to_numpy(dtype=np.float64)[lo:lo+chunk] for x in THRESHOLDS}
+
+        status = {x: levels(feats[x], hist[x], t, perennial if x == 'summer' else None) for x in seasons}
+
+        if reconcile:
+            status['spring'], status['summer'] = rules.reconcile(status['spring'], status['summer'],
+                levels(feats['overlap'], hist['overlap'], t), argmax, split, crp, lambda x: DECODE[x],
+                perennial, list(CLASSES).index('perennial'))
+        else:
+            status = {x: DECODE[lvl] for x, lvl in status.items()}
+
+        for season in seasons:
+            for k, name in enumerate(CLASSES):
+                hit = status[season] == k
+                out.setdefault(season+'_'+name, []).append(np.count_nonzero(hit, axis=1))
+                if area is not None:
+                    out.setdefault(season+'_'+name+'_area', []).append(hit.astype(np.float64) @ area)
+
+    result = combos.reset_index(drop=True)
+    for x, parts in out.items():
+        result[x] = np.concatenate(parts)
+
+    return result.rename_axis('combination')
@@ -0,0 +1,174 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : synthetic.py
+# description     : Synthetic Earth Engine style input for testing and benchmarking at scale. Fields are drawn as
+#                   cropped, fallow or perennial ndvi profiles that persist across years, and every year is written
+#                   as raw .csv exports in the layout process() reads: duplicate and missing observations, 16 day
+#                   acquisitions between the 8 day composites and fields split over several files.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from fam import ingest
+
+# share of cropped, fallow and perennial fields
+KINDS = {'cropped': 0.6, 'fallow': 0.25, 'perennial': 0.15}
+
+# perennial crop groups and types of the crop data
+CROPS = [('Orchard', 'APPLE'), ('Orchard', 'CHERRY'), ('Vineyard', 'GRAPE'), ('Berry', 'BLUEBERRY'), ('Herb', 'HOPS')]
+
+# fields generated at once, bounds memory to a few hundred bytes x chunk x observations per field
+CHUNK = 100000
+
+
+def fields(n, seed=0, start=2):
+    """Draws the fields of a synthetic state.
+
+    Args:
+        n (int): Number of fields.
+
+        seed (int): Random seed, the same seed gives the same fields.
+
+        start (int): First field id, ids 0 and 1 are reserved.
+
+    Returns:
+        DataFrame: A pandas object indexed by id with the kind, crop group
+                   and ndvi profile (base, amplitude, peak day, width) of
+                   every field.
+    """
+    rng = np.random.default_rng(seed)
+    kind = rng.choice(list(KINDS), size=n, p=list(KINDS.values()))
+    crop = rng.integers(len(CROPS), size=n)
+
+    df = pd.DataFrame({'kind': kind,
+        'crop_group': np.where(kind == 'perennial', np.array([x[0] for x in CROPS])[crop], None),
+        'crop_type': np.where(kind == 'perennial', np.array([x[1] for x in CROPS])[crop], None),
+        'base': rng.uniform(0.08, 0.2, n),
+        'amp': np.select([kind == 'cropped', kind == 'fallow'], [rng.uniform(0.4, 0.75, n), rng.uniform(0, 0.25, n)],
+            rng.uniform(0.35, 0.6, n)),
+        'peak': rng.uniform(100, 260, n),
+        'width': np.where(kind == 'perennial', rng.uniform(80, 140, n), rng.uniform(20, 60, n))},
+        index=pd.Index(np.arange(start, start+n), name='id'))
+
+    return df
+
+
+def observations(profile, year, rng, density=(8, 40), gaps=0.15, duplicates=0.1):
+    """Draws the raw observations of a block of fields for a year.
+
+    Args:
+        profile (DataFrame): A block of the output of fields().
+
+        year (int): Year of the observations.
+
+        rng (Generator): Random number generator.
+
+        density (tuple): Smallest and largest number of acquisitions per field.
+
+        gaps (float): Share of observations with a missing ndvi value.
+
+        duplicates (float): Share of observations repeated with another value.
+
+    Returns:
+        DataFrame: A pandas object with ndvi, id and date columns.
+    """
+    composites = pd.to_datetime(ingest.dates(year))
+    acquisitions = pd.date_range("1-05-"+str(year), freq='16D', periods=23)
+    days = np.concatenate([composites, acquisitions])
+
+    n = rng.integers(density[0], density[1], size=len(profile))
+    row = np.repeat(np.arange(len(profile)), n)
+    day = days[rng.integers(len(days), size=len(row))]
+
+    # repeat some observations, e.g. overlapping scenes
+    again = rng.random(len(row)) < duplicates
+    row, day = np.concatenate([row, row[again]]), np.concatenate([day, day[again]])
+
+    doy = pd.DatetimeIndex(day).dayofyear.values
+    p = {x: profile[x].values[row] for x in ['base', 'amp', 'peak', 'width']}
+    ndvi = p['base'] + p['amp']*np.exp(-((doy - p['peak'])/p['width'])**2) + rng.normal(0, 0.03, len(row))
+    ndvi = np.where(rng.random(len(row)) < gaps, np.nan, ndvi.clip(-0.2, 1))
+
+    return pd.DataFrame({'ndvi': ndvi, 'id': profile.index.values[row],
+        'date': pd.DatetimeIndex(day).strftime('%Y-%m-%d')})
+
+
+def write(folder, profile, year, files=4, seed=0, churn=0.01, **kwargs):
+    """Writes a year of synthetic raw .csv exports.
+
+    Fields are split over the files by id, as with exports of separate
+    regions, and a small share of the fields is missing from every year.
+
+    Args:
+        folder (str): Destination folder, e.g. "input/2019".
+
+        profile (DataFrame): Output of fields().
+
+        year (int): Year of the observations.
+
+        files (int): Number of .csv files.
+
+        seed (int): Random seed, combined with the year.
+
+        churn (float): Share of fields without observations in the year.
+
+        **kwargs: Passed on to observations().
+
+    Returns:
+        list: Paths of the written files.
+    """
+    rng = np.random.default_rng([seed, year])
+    profile = profile[rng.random(len(profile)) >= churn]
+    os.makedirs(folder, exist_ok=True)
+
+    paths = []
+    for k, block in enumerate(np.array_split(np.arange(len(profile)), files)):
+        path = os.path.join(folder, str(year)+'_'+str(k)+'.csv')
+        with open(path, 'w') as f:
+            f.write('system:index,NDVI,SIMS_ID,image_time_start_string,.geo\n')
+            count = 0
+            for lo in range(0, len(block), CHUNK):
+                obs = observations(profile.iloc[block[lo:lo+CHUNK]], year, rng, **kwargs)
+                obs.insert(0, 'index', [str(k)+'_'+str(x) for x in range(count, count+len(obs))])
+                obs['geo'] = ''
+                obs.to_csv(f, header=False, index=False, float_format='%.6f')
+                count += len(obs)
+        paths.append(path)
+
+    return paths
+
+
+def tree(root, years, n, files=4, seed=0, **kwargs):
+    """Writes a synthetic state directory ready to run a state script in.
+
+    Args:
+        root (str): State directory, receives input, cache and output folders.
+
+        years (list): Years of input data.
+
+        n (int): Number of fields.
+
+        files (int): Number of .csv files per year.
+
+        seed (int): Random seed.
+
+        **kwargs: Passed on to write() and observations().
+
+    Returns:
+        DataFrame: The generated fields, see fields().
+    """
+    profile = fields(n, seed)
+
+    for year in years:
+        write(os.path.join(root, 'input', str(year)), profile, year, files, seed, **kwargs)
+
+    for x in ['input/crop_data', 'cache', 'output']:
+        os.makedirs(os.path.join(root, x), exist_ok=True)
+    profile[['crop_group', 'crop_type']].to_csv(os.path.join(root, 'input', 'crop_data', 'perennial.csv'))
+
+    return profile
@@ -0,0 +1,72 @@
+# ___________________________________________ NASA AMES RESEARCH CENTER ___________________________________________
+# title           : run.py
+# description     : Runs several state level F.A.M. scripts in a single invocation. Each state runs in its own
+#                   process from its own directory and the available workers are divided between the states.
+#                   Output of each state is written to output/run.log in that state's directory.
+#
+# notes           : Further project details can be found at: https://github.com/Will-Carrara/Fallowed-Area-Mapping
+#                   Example: python run.py California Washington Nevada --workers 32
+# python_version  : 3.*
+# _________________________________________________________________________________________________________________
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+# directory containing the state folders
+root = os.path.dirname(os.path.abspath(__file__))
+
+# create time stamp
+snapshot = lambda start: str(round((time.time() - start)/60,3))
+
+
+def schedule(states, workers, extra):
+    """Launches the state scripts concurrently and waits for them to finish.
+
+    Args:
+        states (list): State names, e.g. ["California", "Nevada"].
+
+        workers (int): Total number of worker processes to divide between states.
+
+        extra (list): Additional options passed through to every script.
+
+    Returns:
+        dict: State name to the exit code of its script.
+    """
+    share = max(1, workers // len(states))
+    procs = {}
+
+    for state in states:
+        cwd = os.path.join(root, state)
+        log = open(os.path.join(cwd, 'output', 'run.log'), 'w')
+        cmd = [sys.executable, 'FAM_'+state+'.py', '--workers', str(share)] + extra
+        procs[state] = (subprocess.Popen(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT), log)
+
+    codes = {}
+    for state, (proc, log) in procs.items():
+        codes[state] = proc.wait()
+        log.close()
+
+    return codes
+
+
+if __name__ == '__main__':
+    start = time.time()
+
+    parser = argparse.ArgumentParser(description="Runs several state F.A.M. scripts at once.")
+    parser.add_argument('states', nargs='+', help="states to run, e.g. California Washington Nevada")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+        help="total number of worker processes shared by all states (default: all cores)")
+    args, extra = parser.parse_known_args()
+
+    codes = schedule(args.states, args.workers, extra)
+
+    for state, code in codes.items():
+        print(state, "finished" if code == 0 else "failed with exit code " + str(code), "(see", state+"/output/run.log).")
+
+    print("Total time to run states:", snapshot(start), "minutes.\n")
+
+    # a state killed by a signal returns a negative code, any non zero code fails the run
+    sys.exit(next((1 for x in codes.values() if x), 0))